@@ -0,0 +1,77 @@
+import time
+from collections import Counter
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE, ENGINES
+from pdf_index import tokenize
+
+
+def agreement(reference, text):
+    """
+    Съвпадение на думите (мултимножества) с еталонния текст: 1.0 = същите думи
+    """
+    ref = Counter(tokenize(reference))
+    got = Counter(tokenize(text))
+    union = sum((ref | got).values())
+    if not union:
+        return 1.0
+    return sum((ref & got).values()) / union
+
+
+def benchmark(pdf_files, engines=None, reference=DEFAULT_ENGINE):
+    """
+    Пуска всяка машина върху pdf_files; връща {engine: {"pages", "seconds",
+    "pages_per_sec", "agreement", "errors"}}. agreement е средното съвпадение
+    по страници спрямо reference.
+    """
+    engines = list(engines or ENGINES)
+    if reference not in engines:
+        engines.insert(0, reference)
+
+    stats = {name: {"pages": 0, "seconds": 0.0, "agreement_sum": 0.0, "errors": 0} for name in engines}
+
+    for pdf_file in pdf_files:
+        texts = {}
+        for name in engines:
+            t0 = time.perf_counter()
+            try:
+                texts[name] = dict(ENGINES[name](pdf_file))
+            except Exception:
+                stats[name]["errors"] += 1
+                texts[name] = {}
+            stats[name]["seconds"] += time.perf_counter() - t0
+            stats[name]["pages"] += len(texts[name])
+
+        ref_pages = texts[reference]
+        for name in engines:
+            for page_number, ref_text in ref_pages.items():
+                stats[name]["agreement_sum"] += agreement(ref_text, texts[name].get(page_number, ""))
+
+    report = {}
+    for name, s in stats.items():
+        ref_count = stats[reference]["pages"]
+        report[name] = {
+            "pages": s["pages"],
+            "seconds": s["seconds"],
+            "pages_per_sec": s["pages"] / s["seconds"] if s["seconds"] else 0.0,
+            "agreement": s["agreement_sum"] / ref_count if ref_count else 0.0,
+            "errors": s["errors"],
+        }
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compare text extraction engines: speed and agreement.")
+    parser.add_argument("directory", help="directory with PDF files")
+    parser.add_argument("--limit", type=int, default=None, help="only the first N files")
+    parser.add_argument("--reference", choices=sorted(ENGINES), default=DEFAULT_ENGINE, help="engine used as ground truth")
+    args = parser.parse_args()
+
+    pdf_files = sorted(Path(args.directory).glob("*.pdf"))[:args.limit]
+    report = benchmark(pdf_files, reference=args.reference)
+
+    print(f"{'engine':<18}{'pages':>8}{'sec':>10}{'pages/s':>10}{'agree':>8}{'errors':>8}")
+    for name, r in report.items():
+        print(f"{name:<18}{r['pages']:>8}{r['seconds']:>10.2f}{r['pages_per_sec']:>10.1f}{r['agreement']:>8.3f}{r['errors']:>8}")
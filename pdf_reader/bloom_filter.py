@@ -0,0 +1,143 @@
+import hashlib
+import json
+import math
+
+from normalize import normalize_text
+
+DEFAULT_ERROR_RATE = 0.01
+PAGE_FILTER_MIN_PAGES = 50  # от този брой страници нагоре се пази и филтър на всяка страница
+GRAM = 3
+
+# Търсенето по ключови думи е по подниз ("безд" намира "бездна"), затова във филтъра
+# влизат триграмите на текста, а не цели думи: ако някоя триграма на ключовата дума
+# липсва, думата със сигурност не се среща. Текстът се взема и суров, и нормализиран
+# (normalize_text), за да важи филтърът и за iter_search(..., normalize=True).
+
+
+def grams(text):
+    """
+    Множеството от триграмите на text (малки букви)
+    """
+    text = text.lower()
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+def page_grams(text):
+    return grams(text) | grams(normalize_text(text))
+
+
+class BloomFilter:
+    """
+    Bloom филтър върху bytearray; hashes позиции от един blake2b хеш (двойно хеширане)
+    """
+
+    def __init__(self, bits, hashes, data=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = bytearray(data) if data is not None else bytearray((bits + 7) // 8)
+
+    @classmethod
+    def for_items(cls, count, error_rate=DEFAULT_ERROR_RATE):
+        """
+        Филтър с размер за count елемента и желания дял грешни "може би"
+        """
+        bits = max(64, int(-count * math.log(error_rate) / math.log(2) ** 2))
+        hashes = max(1, round(bits / max(count, 1) * math.log(2)))
+        return cls(bits, hashes)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.data[pos >> 3] |= 1 << (pos & 7)
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return all(self.data[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def contains_all(self, items):
+        return all(item in self for item in items)
+
+
+def _build(items, error_rate):
+    bloom = BloomFilter.for_items(len(items), error_rate)
+    bloom.update(items)
+    return bloom
+
+
+class DocumentBloom:
+    """
+    Филтър за целия документ и (за големи книги) по един на страница.
+    Строи се страница по страница докато текстът се извлича (add_page), после finish().
+    """
+
+    def __init__(self, error_rate=DEFAULT_ERROR_RATE, min_pages=PAGE_FILTER_MIN_PAGES):
+        self.error_rate = error_rate
+        self.min_pages = min_pages
+        self.document = None
+        self.pages = {}  # page -> BloomFilter
+        self._grams = set()
+
+    def add_page(self, page_number, text):
+        items = page_grams(text)
+        self._grams |= items
+        self.pages[page_number] = _build(items, self.error_rate)
+
+    def finish(self):
+        self.document = _build(self._grams, self.error_rate)
+        self._grams = set()
+        if len(self.pages) < self.min_pages:
+            self.pages = {}
+        return self
+
+    def _filter_matches(self, bloom, patterns):
+        return any(bloom.contains_all(g) for g in patterns)
+
+    def candidate_pages(self, patterns, pages=None):
+        """
+        Страниците, на които някоя от ключовите думи може да се среща:
+        [] – никъде в документа; None – няма филтри по страници (трябват всички)
+        """
+        patterns = [grams(p) for p in patterns if p]
+        if any(not g for g in patterns):
+            return None  # дума от по-малко от 3 букви – филтърът не помага
+        if not self._filter_matches(self.document, patterns):
+            return []
+        if not self.pages:
+            return None
+        wanted = self.pages if pages is None else [p for p in pages if p in self.pages]
+        return [p for p in sorted(wanted) if self._filter_matches(self.pages[p], patterns)]
+
+    def save(self, path):
+        """
+        Първи ред: JSON заглавие (размери на филтрите), после битовете им един след друг
+        """
+        filters = [(None, self.document)] + sorted(self.pages.items())
+        header = {
+            "error_rate": self.error_rate,
+            "filters": [[page, bloom.bits, bloom.hashes] for page, bloom in filters],
+        }
+        with open(path, "wb") as f:
+            f.write(json.dumps(header).encode("utf-8") + b"\n")
+            for _, bloom in filters:
+                f.write(bloom.data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            result = cls(error_rate=header["error_rate"])
+            for page, bits, hashes in header["filters"]:
+                bloom = BloomFilter(bits, hashes, f.read((bits + 7) // 8))
+                if page is None:
+                    result.document = bloom
+                else:
+                    result.pages[page] = bloom
+        return result
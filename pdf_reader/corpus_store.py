@@ -0,0 +1,286 @@
+import json
+import mmap
+import os
+import zlib
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE
+from pdf_index import file_signature
+from pdf_reader import extract_text_by_page
+
+# Корпусът е три файла до един друг:
+#   <name>.bin  – текстът на всички страници (UTF-8) един след друг, по желание на zlib блокове
+#   <name>.idx  – таблица array('q'): по 4 числа на страница (file_id, page, start, length),
+#                 start/length са в байтове в некомпресирания поток
+#   <name>.json – файловете (път, размер, mtime, брой страници, първи ред в таблицата) и блоковете
+CORPUS_VERSION = 1
+DEFAULT_CORPUS_NAME = ".pdf_corpus"
+DEFAULT_BLOCK_SIZE = 1024 * 1024  # некомпресиран размер на zlib блок
+ROW = 4
+BLOCK_CACHE = 8  # брой разкомпресирани блока в паметта
+
+
+def corpus_paths(corpus_path):
+    """
+    (.bin, .idx, .json) за даден корпус (път без разширение)
+    """
+    corpus_path = Path(corpus_path)
+    return (corpus_path.with_name(corpus_path.name + ".bin"),
+            corpus_path.with_name(corpus_path.name + ".idx"),
+            corpus_path.with_name(corpus_path.name + ".json"))
+
+
+def build_corpus(pdf_files, corpus_path, cache=None, engine=DEFAULT_ENGINE, compress=False,
+                 block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Записва текста на всички страници в един файл + таблица с отместванията.
+    compress: zlib блокове от block_size байта (четенето разкомпресира само нужните блокове).
+    Връща [(файл, грешка), ...] за файловете, които не можаха да се извлекат.
+    """
+    bin_path, idx_path, meta_path = corpus_paths(corpus_path)
+    tmp = {p: p.with_name(f"{p.name}.{os.getpid()}.tmp") for p in (bin_path, idx_path, meta_path)}
+
+    table = array("q")
+    files = []
+    errors = []
+    blocks = [0]  # отместване на всеки компресиран блок + краят
+    pending = bytearray()
+    written = 0  # байтове в некомпресирания поток
+
+    with open(tmp[bin_path], "wb") as out:
+        def flush(final=False):
+            while len(pending) >= block_size or (final and pending):
+                chunk = bytes(pending[:block_size])
+                del pending[:block_size]
+                data = zlib.compress(chunk)
+                out.write(data)
+                blocks.append(blocks[-1] + len(data))
+
+        for pdf_file in pdf_files:
+            pdf_file = Path(pdf_file).resolve()
+            size, mtime = file_signature(pdf_file)
+            if cache is not None:
+                page_texts = cache.text_by_page(pdf_file, engine=engine)
+            else:
+                page_texts = extract_text_by_page(pdf_file, engine=engine)
+            try:
+                pages = [(page_number, text.encode("utf-8")) for page_number, text in page_texts]
+            except Exception as e:
+                errors.append((str(pdf_file), f"{type(e).__name__}: {e}"))
+                continue
+
+            file_id = len(files)
+            files.append({"path": str(pdf_file), "size": size, "mtime": mtime,
+                          "pages": pages[-1][0] if pages else 0, "first_row": len(table) // ROW})
+            expected = 1
+            for page_number, data in pages:
+                # липсващите страници са празни, за да е редът = first_row + page - 1
+                for missing in range(expected, page_number):
+                    table.extend((file_id, missing, written, 0))
+                table.extend((file_id, page_number, written, len(data)))
+                expected = page_number + 1
+                if compress:
+                    pending += data
+                    flush()
+                else:
+                    out.write(data)
+                written += len(data)
+
+        if compress:
+            flush(final=True)
+
+    with open(tmp[idx_path], "wb") as f:
+        table.tofile(f)
+
+    meta = {
+        "version": CORPUS_VERSION,
+        "engine": engine,
+        "compression": "zlib" if compress else None,
+        "block_size": block_size,
+        "blocks": blocks if compress else [],
+        "size": written,
+        "files": files,
+    }
+    with open(tmp[meta_path], "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+    # метаданните последни – корпусът се вижда като цял едва след като и трите са на място
+    for path in (bin_path, idx_path, meta_path):
+        os.replace(tmp[path], path)
+    return errors
+
+
+class CorpusStore:
+    """
+    Чете корпус от build_corpus: .bin се отваря с mmap, таблицата се зарежда в array.
+    Текстът на страница се взема без отваряне на PDF-а (некомпресиран – директно
+    от mmap буфера). Може да се подаде като extractor на iter_search/search_library:
+    файловете извън корпуса или променените след изграждането се извличат наново.
+    """
+
+    def __init__(self, corpus_path):
+        self.corpus_path = Path(corpus_path)
+        bin_path, idx_path, meta_path = corpus_paths(self.corpus_path)
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != CORPUS_VERSION:
+            raise ValueError(f"Неподдържана версия на корпуса: {meta.get('version')}")
+
+        self.engine = meta["engine"]
+        self.compression = meta["compression"]
+        self.block_size = meta["block_size"]
+        self.blocks = meta["blocks"]
+        self.size = meta["size"]
+        self.files = meta["files"]
+        self._by_path = {f["path"]: i for i, f in enumerate(self.files)}
+
+        self.table = array("q")
+        with open(idx_path, "rb") as f:
+            self.table.frombytes(f.read())
+
+        self._file = open(bin_path, "rb")
+        # mmap на празен файл не е позволен
+        self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(self._file.fileno()).st_size else b""
+        self._blocks = OrderedDict()
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # mmap не може да се pickle-ва; работните процеси отварят корпуса наново по пътя
+    def __getstate__(self):
+        return {"corpus_path": self.corpus_path}
+
+    def __setstate__(self, state):
+        self.__init__(state["corpus_path"])
+
+    def __len__(self):
+        return len(self.table) // ROW
+
+    def row(self, i):
+        """
+        (file_id, page, start, length) на i-тия ред от таблицата
+        """
+        return tuple(self.table[i * ROW:(i + 1) * ROW])
+
+    def find_file(self, pdf_path):
+        """
+        file_id на актуален запис за pdf_path или None
+        """
+        file_id = self._by_path.get(str(Path(pdf_path).resolve()))
+        if file_id is None:
+            return None
+        entry = self.files[file_id]
+        try:
+            if file_signature(entry["path"]) != (entry["size"], entry["mtime"]):
+                return None
+        except OSError:
+            return None
+        return file_id
+
+    def _block(self, i):
+        data = self._blocks.get(i)
+        if data is None:
+            data = zlib.decompress(self.buffer[self.blocks[i]:self.blocks[i + 1]])
+            self._blocks[i] = data
+            if len(self._blocks) > BLOCK_CACHE:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(i)
+        return data
+
+    def read(self, start, length):
+        """
+        Байтовете [start, start + length) от некомпресирания поток
+        """
+        if not self.compression:
+            return self.buffer[start:start + length]
+
+        end = start + length
+        parts = []
+        i = start // self.block_size
+        while start < end:
+            block = self._block(i)
+            offset = start - i * self.block_size
+            take = min(end - start, len(block) - offset)
+            parts.append(block[offset:offset + take])
+            start += take
+            i += 1
+        return b"".join(parts)
+
+    def page_text(self, file_id, page_number):
+        first = self.files[file_id]["first_row"]
+        _, _, start, length = self.row(first + page_number - 1)
+        return self.read(start, length).decode("utf-8")
+
+    def iter_pages(self, rows=None):
+        """
+        Генератор: (file_id, page, text) за всички страници (или за редовете rows) по реда на корпуса
+        """
+        for i in range(len(self)) if rows is None else rows:
+            file_id, page_number, start, length = self.row(i)
+            yield file_id, page_number, self.read(start, length).decode("utf-8")
+
+    def __call__(self, pdf_path, pages=None, engine=DEFAULT_ENGINE, timings=None):
+        return self.text_by_page(pdf_path, pages=pages, engine=engine, timings=timings)
+
+    def text_by_page(self, pdf_path, pages=None, engine=DEFAULT_ENGINE, timings=None):
+        """
+        Като extract_text_by_page, но от корпуса (ако файлът е в него и машината съвпада)
+        """
+        file_id = self.find_file(pdf_path) if engine == self.engine else None
+        if file_id is None:
+            yield from extract_text_by_page(pdf_path, pages=pages, engine=engine, timings=timings)
+            return
+
+        count = self.files[file_id]["pages"]
+        wanted = range(1, count + 1) if pages is None else sorted(p for p in set(pages) if 1 <= p <= count)
+        for page_number in wanted:
+            yield page_number, self.page_text(file_id, page_number)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack extracted page text of a PDF directory into one memory-mapped corpus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="extract all *.pdf files into a corpus")
+    p_build.add_argument("directory", help="directory with PDF files")
+    p_build.add_argument("--corpus", help=f"corpus path without extension (default: <directory>/{DEFAULT_CORPUS_NAME})")
+    p_build.add_argument("--engine", default=DEFAULT_ENGINE, help="text extraction engine")
+    p_build.add_argument("--compress", action="store_true", help="zlib-compress the text in blocks")
+    p_build.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="uncompressed block size in bytes")
+    p_build.add_argument("--cache", action="store_true", help="read/write page text through the page cache")
+
+    p_info = sub.add_parser("info", help="show corpus statistics")
+    p_info.add_argument("corpus", help="corpus path without extension")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        directory = Path(args.directory)
+        corpus_path = Path(args.corpus) if args.corpus else directory / DEFAULT_CORPUS_NAME
+        cache = None
+        if args.cache:
+            from page_cache import PageCache
+            cache = PageCache()
+        errors = build_corpus(sorted(directory.glob("*.pdf")), corpus_path, cache=cache, engine=args.engine,
+                              compress=args.compress, block_size=args.block_size)
+        for path, error in errors:
+            print(f"⚠️ Грешка ({Path(path).name}): {error}")
+        args.corpus = corpus_path
+
+    with CorpusStore(args.corpus) as store:
+        bin_size = corpus_paths(store.corpus_path)[0].stat().st_size
+        print(f"Файлове: {len(store.files)}, страници: {len(store)}, текст: {store.size} B, на диска: {bin_size} B"
+              f" ({store.compression or 'без компресия'}) -> {store.corpus_path}")
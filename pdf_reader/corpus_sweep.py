@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import re
+
+from corpus_store import ROW, CorpusStore
+from pdf_reader import get_context
+
+DEFAULT_SHARD_BYTES = 8 * 1024 * 1024  # текст на парче (по границите на страниците)
+
+# Състояние на работния процес (зарежда се веднъж от _init_worker)
+_worker_store = None
+_worker_pattern = None
+
+
+def make_shards(store, shard_bytes=DEFAULT_SHARD_BYTES):
+    """
+    Разделя редовете на корпуса на поредни парчета [first, last) по около shard_bytes
+    байта; страница никога не се разделя между две парчета
+    """
+    shards = []
+    first = 0
+    size = 0
+    table = store.table
+    for i in range(len(store)):
+        size += table[i * ROW + 3]
+        if size >= shard_bytes:
+            shards.append((first, i + 1))
+            first, size = i + 1, 0
+    if first < len(store):
+        shards.append((first, len(store)))
+    return shards
+
+
+def _init_worker(corpus_path, regex, flags):
+    global _worker_store, _worker_pattern
+    _worker_store = CorpusStore(corpus_path)
+    _worker_pattern = re.compile(regex, flags)
+
+
+def _scan_shard(shard):
+    """
+    [(file_id, page, start, end, съвпадение, контекст), ...] за редовете на парчето
+    """
+    first, last = shard
+    hits = []
+    for file_id, page_number, text in _worker_store.iter_pages(range(first, last)):
+        for match in _worker_pattern.finditer(text):
+            start, end = match.span()
+            hits.append((file_id, page_number, start, end, match.group(), get_context(text, start, end)))
+    return hits
+
+
+def sweep_corpus(corpus_path, regex, workers=None, shard_bytes=DEFAULT_SHARD_BYTES, flags=re.IGNORECASE):
+    """
+    Regex по целия корпус (corpus_store.py) в пул от процеси. Корпусът се разделя
+    на парчета по границите на страниците; всеки процес отваря корпуса (mmap) и
+    компилира израза веднъж. Генератор: {"file", "page", "pattern", "span", "context"}
+    в реда на корпуса (файл, страница, позиция); span е в текста на страницата.
+    """
+    with CorpusStore(corpus_path) as store:
+        files = [f["path"] for f in store.files]
+        shards = make_shards(store, shard_bytes)
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(corpus_path, regex, flags)
+        results = map(_scan_shard, shards)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes=workers, initializer=_init_worker, initargs=(str(corpus_path), regex, flags))
+        results = pool.imap(_scan_shard, shards)
+
+    try:
+        for hits in results:
+            for file_id, page_number, start, end, text, context in hits:
+                yield {
+                    "file": files[file_id],
+                    "page": page_number,
+                    "pattern": text,
+                    "span": (start, end),
+                    "context": context,
+                }
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from pathlib import Path
+
+    from corpus_store import DEFAULT_CORPUS_NAME
+    from pdf_reader import hit_to_jsonl
+
+    parser = argparse.ArgumentParser(description="Parallel regex sweep over a page text corpus (see corpus_store.py).")
+    parser.add_argument("corpus", help=f"corpus path without extension, or a PDF directory (uses <directory>/{DEFAULT_CORPUS_NAME})")
+    parser.add_argument("regex", help="regular expression (case-insensitive)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_BYTES // 1024 ** 2, help="text per shard in MB")
+    parser.add_argument("--jsonl", action="store_true", help="print hits as JSON lines")
+    args = parser.parse_args()
+
+    corpus_path = Path(args.corpus)
+    if corpus_path.is_dir():
+        corpus_path = corpus_path / DEFAULT_CORPUS_NAME
+
+    count = 0
+    for hit in sweep_corpus(corpus_path, args.regex, workers=args.workers, shard_bytes=args.shard_size * 1024 ** 2):
+        count += 1
+        if args.jsonl:
+            sys.stdout.write(hit_to_jsonl(hit.pop("file"), hit))
+        else:
+            print(f"{Path(hit['file']).name}\tстр. {hit['page']}\t{hit['pattern']}\t{hit['context']}")
+    print(f"Съвпадения: {count}", file=sys.stderr)
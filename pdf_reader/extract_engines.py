@@ -0,0 +1,204 @@
+# Машини за извличане на текст по страници.
+# Всяка е генератор (pdf_path, pages) -> (page_number, text); pages е
+# сортиран списък с номера от 1 или None за всички страници; timings е
+# по желание SearchTimings (search_timing.py) за времената по етапи.
+
+import time
+from array import array
+from bisect import bisect_right
+
+DEFAULT_ENGINE = "pdfminer-layout"
+BOX_LEVELS = ("blocks", "lines")  # правоъгълници на текстов блок (LTTextBox) или на ред (LTTextLine)
+
+
+class PageBoxes:
+    """
+    Правоъгълниците на текста на една страница, подредени като текста: starts[i] е
+    позицията в текста, от която започва i-тият правоъгълник (до starts[i + 1]),
+    coords[4 * i: 4 * i + 4] = x0, y0, x1, y1 в координатите на pdfminer (точки,
+    от долния ляв ъгъл на MediaBox). Два масива вместо списък от обекти – малко памет.
+    """
+
+    def __init__(self):
+        self.starts = array("I")
+        self.coords = array("f")
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add(self, start, bbox):
+        self.starts.append(start)
+        self.coords.extend(bbox)
+
+    def find(self, start, end):
+        """
+        [[x0, y0, x1, y1], ...] на правоъгълниците, които покриват text[start:end]
+        """
+        result = []
+        i = max(0, bisect_right(self.starts, start) - 1)
+        while i < len(self.starts) and self.starts[i] < max(end, start + 1):
+            next_start = self.starts[i + 1] if i + 1 < len(self.starts) else None
+            if next_start is None or next_start > start:
+                result.append([round(c, 2) for c in self.coords[4 * i:4 * i + 4]])
+            i += 1
+        return result
+
+
+def _pdfminer_pages(pdf_path, pages, timings=None):
+    """
+    Разбира страниците с pdfminer без layout анализ; връща (page_number, LTPage).
+    Времето за разбор се записва като етап "parse".
+    """
+    from pdfminer.converter import PDFPageAggregator
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
+
+    if pages is not None and not pages:
+        return
+    rsrcmgr = PDFResourceManager()
+    device = PDFPageAggregator(rsrcmgr, laparams=None)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    wanted = set(pages) if pages is not None else None
+    # maxpages спира обхождането на дървото със страници след последната нужна
+    maxpages = max(pages) if pages is not None else 0
+
+    with open(pdf_path, "rb") as fp:
+        # номерът е поредният номер на страницата в документа, не поредният от pages
+        for page_number, page in enumerate(PDFPage.get_pages(fp, maxpages=maxpages), start=1):
+            if wanted is not None and page_number not in wanted:
+                continue
+            t0 = time.perf_counter()
+            interpreter.process_page(page)
+            ltpage = device.get_result()
+            if timings is not None:
+                timings.add(pdf_path, page_number, "parse", time.perf_counter() - t0)
+            yield page_number, ltpage
+
+
+def _layout_pages(pdf_path, pages, timings=None, boxes=None):
+    """
+    (page_number, text, PageBoxes или None) след layout анализ на pdfminer.
+    boxes: None, "blocks" или "lines" – на какво ниво да се пазят правоъгълниците
+    """
+    from pdfminer.layout import LAParams, LTTextBox, LTTextContainer
+
+    laparams = LAParams()
+    for page_number, ltpage in _pdfminer_pages(pdf_path, pages, timings):
+        t0 = time.perf_counter()
+        ltpage.analyze(laparams)
+        t1 = time.perf_counter()
+
+        page_text = []
+        page_boxes = PageBoxes() if boxes else None
+        pos = 0
+        for element in ltpage:
+            if not isinstance(element, LTTextContainer):
+                continue
+            element_text = element.get_text()
+            if page_boxes is not None:
+                if boxes == "lines" and isinstance(element, LTTextBox):
+                    # текстът на блока е текстът на редовете му един след друг
+                    line_pos = pos
+                    for line in element:
+                        if isinstance(line, LTTextContainer):
+                            page_boxes.add(line_pos, line.bbox)
+                            line_pos += len(line.get_text())
+                else:
+                    page_boxes.add(pos, element.bbox)
+            page_text.append(element_text)
+            pos += len(element_text)
+        text = "".join(page_text)
+
+        if timings is not None:
+            timings.add(pdf_path, page_number, "layout", t1 - t0)
+            timings.add(pdf_path, page_number, "text", time.perf_counter() - t1)
+            timings.set_chars(pdf_path, page_number, len(text))
+        yield page_number, text, page_boxes
+
+
+def pdfminer_layout(pdf_path, pages=None, timings=None):
+    """
+    Пълен layout анализ на pdfminer (LAParams по подразбиране) – най-бавно, най-точно.
+    Същото като extract_pages, но анализът се прави отделно, за да се мери.
+    """
+    for page_number, text, _ in _layout_pages(pdf_path, pages, timings):
+        yield page_number, text
+
+
+def pdfminer_layout_boxes(pdf_path, pages=None, timings=None, level="blocks"):
+    """
+    Като pdfminer_layout, но връща (page_number, text, PageBoxes) – правоъгълниците,
+    които layout анализът така или иначе изчислява, без втори разбор на страницата.
+    level: "blocks" (текстов блок) или "lines" (всеки ред поотделно)
+    """
+    if level not in BOX_LEVELS:
+        raise ValueError(f"Непознато ниво на правоъгълниците: {level} (налични: {', '.join(BOX_LEVELS)})")
+    yield from _layout_pages(pdf_path, pages, timings, boxes=level)
+
+
+def pdfminer_raw(pdf_path, pages=None, timings=None):
+    """
+    pdfminer без layout анализ: символите се взимат в реда на потока на
+    съдържанието; нов ред при смяна на базовата линия, интервал при празнина
+    """
+    from pdfminer.layout import LTChar
+
+    for page_number, ltpage in _pdfminer_pages(pdf_path, pages, timings):
+        t0 = time.perf_counter()
+        parts = []
+        prev = None
+        for item in ltpage:
+            if not isinstance(item, LTChar):
+                continue
+            if prev is not None:
+                if abs(item.y0 - prev.y0) > prev.height * 0.5:
+                    parts.append("\n")
+                elif item.x0 - prev.x1 > prev.width * 0.3 and prev.get_text() != " ":
+                    parts.append(" ")
+            parts.append(item.get_text())
+            prev = item
+        if parts:
+            parts.append("\n")
+        text = "".join(parts)
+
+        if timings is not None:
+            timings.add(pdf_path, page_number, "text", time.perf_counter() - t0)
+            timings.set_chars(pdf_path, page_number, len(text))
+        yield page_number, text
+
+
+def pypdf_text(pdf_path, pages=None, timings=None):
+    """
+    pypdf PageObject.extract_text() – разборът и сглобяването на текста са
+    един етап и се записват като "parse"
+    """
+    from pypdf import PdfReader
+
+    reader = PdfReader(str(pdf_path), strict=False)
+    if pages is None:
+        pages = range(1, len(reader.pages) + 1)
+    for page_number in pages:
+        if page_number < 1:
+            continue
+        if page_number > len(reader.pages):
+            break
+        t0 = time.perf_counter()
+        text = reader.pages[page_number - 1].extract_text() or ""
+        if timings is not None:
+            timings.add(pdf_path, page_number, "parse", time.perf_counter() - t0)
+            timings.set_chars(pdf_path, page_number, len(text))
+        yield page_number, text
+
+
+ENGINES = {
+    "pdfminer-layout": pdfminer_layout,
+    "pdfminer-raw": pdfminer_raw,
+    "pypdf": pypdf_text,
+}
+
+
+def get_engine(name):
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Непозната машина за извличане: {name} (налични: {', '.join(ENGINES)})") from None
@@ -0,0 +1,215 @@
+import os
+import sqlite3
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE
+from pdf_reader import extract_text_by_page
+
+DEFAULT_DB_NAME = ".pdf_fts.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    page_count INTEGER NOT NULL,
+    engine TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(
+    text,
+    file_id UNINDEXED,
+    page UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+# rowid на страница = file_id * MAX_PAGES + page, за да се трие файл с диапазон по rowid
+# (file_id в FTS5 таблицата е UNINDEXED и WHERE по него обхожда всички редове)
+MAX_PAGES = 1 << 20
+
+
+def page_rowid(file_id, page_number):
+    return file_id * MAX_PAGES + page_number
+
+
+def quote_terms(keywords, operator="OR"):
+    """
+    ["бездна", "черна дупка"] -> '"бездна" OR "черна дупка"' (фрази в кавички за FTS5 MATCH)
+    """
+    quoted = ['"' + kw.replace('"', '""') + '"' for kw in keywords if kw.strip()]
+    return f" {operator} ".join(quoted)
+
+
+class FtsStore:
+    """
+    Пълнотекстово търсене по страници в локална SQLite FTS5 база:
+    ред на страница (file_id, page, text) + таблица files с метаданни.
+    Поддържа добавяне/изтриване на отделни файлове и подредени (bm25) резултати с откъси.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.conn = sqlite3.connect(str(self.db_path))
+        try:
+            self.conn.executescript(SCHEMA)
+        except sqlite3.OperationalError as e:
+            self.conn.close()
+            raise RuntimeError(f"SQLite без FTS5 поддръжка ({sqlite3.sqlite_version}): {e}") from e
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file_id(self, pdf_path):
+        row = self.conn.execute("SELECT id FROM files WHERE path = ?", (str(Path(pdf_path).resolve()),)).fetchone()
+        return row[0] if row else None
+
+    def is_current(self, pdf_path):
+        """
+        True, ако файлът е в базата със същите размер и mtime
+        """
+        st = os.stat(pdf_path)
+        row = self.conn.execute(
+            "SELECT size, mtime FROM files WHERE path = ?", (str(Path(pdf_path).resolve()),)
+        ).fetchone()
+        return row is not None and tuple(row) == (st.st_size, st.st_mtime_ns)
+
+    def add_file(self, pdf_path, cache=None, engine=DEFAULT_ENGINE, page_texts=None):
+        """
+        Добавя (или заменя) страниците на един файл; текстът идва от page_texts,
+        кеша или extract_text_by_page. Всичко е в една транзакция.
+        """
+        pdf_path = Path(pdf_path).resolve()
+        st = os.stat(pdf_path)
+        if page_texts is None:
+            if cache is not None:
+                page_texts = cache.text_by_page(pdf_path, engine=engine)
+            else:
+                page_texts = extract_text_by_page(pdf_path, engine=engine)
+
+        # Извличаме преди транзакцията, за да не държим базата заключена по време на pdfminer
+        rows = list(page_texts)
+
+        with self.conn:
+            self._delete(pdf_path)
+            cur = self.conn.execute(
+                "INSERT INTO files (path, name, size, mtime, page_count, engine) VALUES (?, ?, ?, ?, ?, ?)",
+                (str(pdf_path), pdf_path.name, st.st_size, st.st_mtime_ns, len(rows), engine),
+            )
+            file_id = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO pages (rowid, text, file_id, page) VALUES (?, ?, ?, ?)",
+                ((page_rowid(file_id, page_number), text, file_id, page_number) for page_number, text in rows),
+            )
+        return file_id
+
+    def _delete(self, pdf_path):
+        file_id = self.file_id(pdf_path)
+        if file_id is None:
+            return False
+        self.conn.execute(
+            "DELETE FROM pages WHERE rowid BETWEEN ? AND ?",
+            (page_rowid(file_id, 0), page_rowid(file_id, MAX_PAGES - 1)),
+        )
+        self.conn.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        return True
+
+    def remove_file(self, pdf_path):
+        """
+        Изтрива файла и страниците му от базата
+        """
+        with self.conn:
+            return self._delete(pdf_path)
+
+    def sync(self, pdf_files, cache=None, engine=DEFAULT_ENGINE):
+        """
+        Добавя новите/променените файлове и трие изчезналите;
+        връща (добавени, изтрити, [(файл, грешка), ...])
+        """
+        wanted = {str(Path(p).resolve()) for p in pdf_files}
+        added = 0
+        errors = []
+        for path in sorted(wanted):
+            if self.is_current(path):
+                continue
+            try:
+                self.add_file(path, cache=cache, engine=engine)
+                added += 1
+            except Exception as e:
+                errors.append((path, f"{type(e).__name__}: {e}"))
+
+        removed = 0
+        for (path,) in self.conn.execute("SELECT path FROM files").fetchall():
+            if path not in wanted:
+                self.remove_file(path)
+                removed += 1
+        return added, removed, errors
+
+    def search(self, query, limit=20, offset=0, snippet_tokens=16):
+        """
+        FTS5 заявка (MATCH синтаксис: думи, "фрази", AND/OR/NOT, NEAR, префикс*).
+        Връща [{"file", "page", "score", "snippet"}] по релевантност (bm25, по-малко = по-добре).
+        """
+        rows = self.conn.execute(
+            """
+            SELECT files.path, pages.page, bm25(pages) AS score,
+                   snippet(pages, 0, '[', ']', '…', ?)
+            FROM pages JOIN files ON files.id = pages.file_id
+            WHERE pages MATCH ?
+            ORDER BY score
+            LIMIT ? OFFSET ?
+            """,
+            (snippet_tokens, query, limit, offset),
+        ).fetchall()
+        return [
+            {"file": path, "page": page, "score": score, "snippet": snippet.replace("\n", " ")}
+            for path, page, score, snippet in rows
+        ]
+
+    def optimize(self):
+        """
+        Слива вътрешните b-tree сегменти на FTS5 (след много добавяния/изтривания)
+        """
+        with self.conn:
+            self.conn.execute("INSERT INTO pages (pages) VALUES ('optimize')")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQLite FTS5 full-text index of a PDF directory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_sync = sub.add_parser("sync", help="add new/changed PDFs and drop deleted ones")
+    p_sync.add_argument("directory", help="directory with PDF files")
+    p_sync.add_argument("--db", help=f"database file (default: <directory>/{DEFAULT_DB_NAME})")
+    p_sync.add_argument("--engine", default=DEFAULT_ENGINE, help="text extraction engine")
+
+    p_search = sub.add_parser("search", help="ranked full-text query")
+    p_search.add_argument("db", help="database file")
+    p_search.add_argument("query", help='FTS5 query, e.g. \'бездна OR "черна дупка"\'')
+    p_search.add_argument("--limit", type=int, default=20)
+    p_search.add_argument("--offset", type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        directory = Path(args.directory)
+        db_path = Path(args.db) if args.db else directory / DEFAULT_DB_NAME
+        with FtsStore(db_path) as store:
+            added, removed, errors = store.sync(sorted(directory.glob("*.pdf")), engine=args.engine)
+        for path, error in errors:
+            print(f"⚠️ Грешка ({Path(path).name}): {error}")
+        print(f"Добавени/обновени: {added}, изтрити: {removed} -> {db_path}")
+    else:
+        with FtsStore(args.db) as store:
+            for r in store.search(args.query, limit=args.limit, offset=args.offset):
+                print(f"{Path(r['file']).name}\tстр. {r['page']}\t{r['score']:.2f}\t{r['snippet']}")
@@ -0,0 +1,161 @@
+import json
+import sys
+from pathlib import Path
+
+# Износ на резултати като PDF с подчертавания (Highlight анотации, pypdf).
+# Резултатите се групират по файл; всеки PDF се отваря веднъж и всички
+# анотации към него се записват с едно записване на изходния файл.
+
+HIGHLIGHT_COLOR = "ffff00"
+NOTE_SIZE = 20  # размер на бележката за резултат без координати (точки)
+
+
+def _quad_points(boxes, left, bottom):
+    """
+    QuadPoints за правоъгълниците: за всеки – горе ляво, горе дясно, долу ляво, долу дясно
+    """
+    points = []
+    for x0, y0, x1, y1 in boxes:
+        x0, x1, y0, y1 = x0 + left, x1 + left, y0 + bottom, y1 + bottom
+        points.extend([x0, y1, x1, y1, x0, y0, x1, y0])
+    return points
+
+
+def _page_marks(hits):
+    """
+    {страница: [(boxes, [заглавия], [редове за бележката]), ...]} – резултат през две страници
+    се отбелязва на двете. Резултатите с еднакви правоъгълници (напр. няколко думи на един
+    ред) стават една анотация, а всички без координати на една страница – една бележка.
+    """
+    marks = {}
+    merged = {}
+    for hit in hits:
+        label = hit.get("keyword") or hit.get("pattern") or ""
+        parts = [(hit["page"], hit.get("boxes"))]
+        if "end_page" in hit:
+            parts.append((hit["end_page"], hit.get("end_boxes")))
+        for page, boxes in parts:
+            key = (page, json.dumps(boxes or None))
+            mark = merged.get(key)
+            if mark is None:
+                mark = merged[key] = (boxes, [], [])
+                marks.setdefault(page, []).append(mark)
+            if label not in mark[1]:
+                mark[1].append(label)
+            mark[2].append(f"{label}: {hit.get('context', '')}")
+    return marks
+
+
+def annotate_pdf(pdf_path, hits, output_path, pages_only=False):
+    """
+    Записва копие на pdf_path с Highlight анотация за всеки резултат (от iter_search).
+    Резултатите с "boxes" (iter_search(..., boxes="lines")) се подчертават точно; за
+    останалите се слага бележка (Text анотация) в горния ляв ъгъл на страницата.
+    pages_only: само страниците с резултати (в реда им в документа) вместо целия документ.
+    Връща броя на анотациите.
+    """
+    from pypdf import PdfReader, PdfWriter
+    from pypdf.annotations import Highlight, Text
+    from pypdf.generic import ArrayObject, FloatObject, NameObject, TextStringObject
+
+    reader = PdfReader(str(pdf_path), strict=False)
+    marks = _page_marks(hits)
+    pages = sorted(p for p in marks if 1 <= p <= len(reader.pages))
+
+    if pages_only:
+        writer = PdfWriter()
+        for page in pages:
+            writer.add_page(reader.pages[page - 1])
+        position = {page: i for i, page in enumerate(pages)}
+    else:
+        writer = PdfWriter(clone_from=reader)
+        position = {page: page - 1 for page in pages}
+
+    count = 0
+    for page in pages:
+        mediabox = reader.pages[page - 1].mediabox
+        # координатите от pdfminer са спрямо долния ляв ъгъл на MediaBox
+        left, bottom = float(mediabox.left), float(mediabox.bottom)
+        for boxes, labels, notes in marks[page]:
+            if boxes:
+                quads = _quad_points(boxes, left, bottom)
+                rect = (min(quads[0::2]), min(quads[1::2]), max(quads[0::2]), max(quads[1::2]))
+                annotation = Highlight(
+                    rect=rect,
+                    quad_points=ArrayObject(FloatObject(v) for v in quads),
+                    highlight_color=HIGHLIGHT_COLOR,
+                    printing=True,
+                )
+                annotation[NameObject("/Contents")] = TextStringObject(", ".join(labels))
+            else:
+                top = float(mediabox.top)
+                annotation = Text(rect=(left, top - NOTE_SIZE, left + NOTE_SIZE, top), text="\n".join(notes))
+            writer.add_annotation(page_number=position[page], annotation=annotation)
+            count += 1
+
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        writer.write(f)
+    tmp_path.replace(output_path)
+    return count
+
+
+def export_highlights(hits, output_dir, pages_only=False):
+    """
+    hits: резултати с "file" (напр. редовете от pdf_reader.py --jsonl).
+    За всеки PDF записва <output_dir>/<име>.highlighted.pdf (или .hits.pdf с pages_only).
+    Връща (записани, грешки): [(pdf, изход, анотации)], [(pdf, грешка)].
+    """
+    by_file = {}
+    for hit in hits:
+        by_file.setdefault(hit["file"], []).append(hit)
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = ".hits.pdf" if pages_only else ".highlighted.pdf"
+
+    written = []
+    errors = []
+    for pdf_file, file_hits in by_file.items():
+        output_path = output_dir / (Path(pdf_file).stem + suffix)
+        try:
+            written.append((pdf_file, output_path, annotate_pdf(pdf_file, file_hits, output_path, pages_only)))
+        except Exception as e:
+            errors.append((pdf_file, f"{type(e).__name__}: {e}"))
+    return written, errors
+
+
+def read_hits(path):
+    """
+    Резултатите от JSONL файл ('-' за stdin); редовете без "page" (напр. от -l) се пропускат
+    """
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        hits = []
+        for line in f:
+            line = line.strip()
+            if line:
+                hit = json.loads(line)
+                if "page" in hit:
+                    hits.append(hit)
+        return hits
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Write search hits (pdf_reader.py --jsonl) into PDFs as highlight annotations.")
+    parser.add_argument("hits", help="JSON lines file with hits ('-' for stdin); use --boxes lines for exact highlights")
+    parser.add_argument("output", help="output directory")
+    parser.add_argument("--pages-only", action="store_true", help="write only the pages with hits instead of the whole document")
+    args = parser.parse_args()
+
+    written, errors = export_highlights(read_hits(args.hits), args.output, pages_only=args.pages_only)
+    for pdf_file, output_path, count in written:
+        print(f"📄 {Path(pdf_file).name} -> {output_path} ({count} анотации)")
+    for pdf_file, error in errors:
+        print(f"⚠️ Грешка ({Path(pdf_file).name}): {error}", file=sys.stderr)
@@ -0,0 +1,438 @@
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE
+from pdf_index import INDEX_VERSION, candidate_pages, file_signature, load_index, save_index, search_index, update_index
+from packed_postings import pack_postings, raw_postings, remap_postings
+
+# Индексът като неизменими сегменти (както в LSM дърветата):
+#   <папка>/.pdf_segments/seg-000001.bin ...  – всеки е обикновен индекс от pdf_index
+#   <папка>/.pdf_segments/manifest.json        – кои сегменти са живи и кои файлове в тях са изтрити
+# Новите файлове отиват в нов малък сегмент; изтритите/променените само се отбелязват
+# в манифеста. Сливането (compact) пренаписва няколко сегмента в един без изтритите файлове.
+# Слетите сегменти не се трият веднага, а се отбелязват в манифеста ("retired") и се трият
+# при следващо сливане след RETIRE_GRACE секунди – четец със стария манифест още ги намира.
+# Пише само един процес (напр. library_watch.py); търсенето може от много.
+MANIFEST_VERSION = 1
+DEFAULT_SEGMENTS_NAME = ".pdf_segments"
+MERGE_FACTOR = 4  # толкова сегмента от едно ниво (по брой файлове) се сливат в един
+MAX_DELETED_RATIO = 0.5  # сегмент с повече изтрити файлове се пренаписва
+RETIRE_GRACE = 600.0  # секунди, през които слетите сегменти остават на диска
+
+
+def _empty_index():
+    return {"version": INDEX_VERSION, "files": [], "postings": {}}
+
+
+def index_generation(index_path):
+    """
+    Поколение на индекс-файл или на папка със сегменти (от манифеста); None, ако липсва
+    """
+    index_path = Path(index_path)
+    if not index_path.is_dir():
+        from pdf_index import index_generation as file_generation
+        return file_generation(index_path)
+    try:
+        with open(index_path / "manifest.json", encoding="utf-8") as f:
+            return json.load(f).get("generation")
+    except (OSError, ValueError):
+        return None
+
+
+def open_index(index_path):
+    """
+    Папка със сегменти -> SegmentedIndex, файл -> pdf_index.load_index
+    """
+    if Path(index_path).is_dir():
+        return SegmentedIndex(index_path)
+    return load_index(index_path)
+
+
+class SegmentedIndex:
+    """
+    Индекс от неизменими сегменти с отбелязани изтрити файлове.
+    Търсенето (search_index, search_query, bm25_search, candidate_pages) обхожда
+    всички сегменти и пропуска изтритите файлове.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.directory / "manifest.json"
+        self._lock = threading.RLock()
+        self._loaded = {}  # име на сегмент -> индекс
+        self._live = None  # (поколение, live_files()) – виж live_files
+        self._compactor = None
+        self.reload()
+
+    def reload(self):
+        """
+        Чете манифеста отново (след промени от друг процес)
+        """
+        with self._lock:
+            try:
+                with open(self.manifest_path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                manifest = None
+            if manifest is None or manifest.get("version") != MANIFEST_VERSION:
+                manifest = {"version": MANIFEST_VERSION, "generation": 0, "segments": [], "deleted": {}}
+            self.generation = manifest["generation"]
+            self.names = manifest["segments"]
+            self.deleted = {name: set(ids) for name, ids in manifest["deleted"].items()}
+            self.retired = dict(manifest.get("retired", {}))  # слят сегмент -> кога
+            self._loaded = {name: index for name, index in self._loaded.items() if name in self.names}
+
+    def _save_manifest(self):
+        self.generation += 1  # всяка промяна (и само отбелязано изтриване) е ново поколение
+        manifest = {
+            "version": MANIFEST_VERSION,
+            "generation": self.generation,
+            "segments": self.names,
+            "deleted": {name: sorted(ids) for name, ids in self.deleted.items() if ids},
+            "retired": self.retired,
+        }
+        tmp_path = self.manifest_path.with_name(f"manifest.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def segment(self, name):
+        index = self._loaded.get(name)
+        if index is None:
+            index = load_index(self.directory / name)
+            if index is None:
+                raise ValueError(f"Сегментът {name} липсва или е от друга версия")
+            self._loaded[name] = index
+        return index
+
+    def segments(self):
+        """
+        [(име, индекс, изтрити file_id), ...] в реда на създаване.
+        Ако сегмент от манифеста вече липсва (слят и изтрит от друг процес), манифестът
+        се чете наново и се опитва още веднъж.
+        """
+        with self._lock:
+            try:
+                return [(name, self.segment(name), set(self.deleted.get(name, ()))) for name in self.names]
+            except ValueError:
+                self.reload()
+                return [(name, self.segment(name), set(self.deleted.get(name, ()))) for name in self.names]
+
+    def live_files(self):
+        """
+        път -> (сегмент, file_id) на живите записи. Картата се помни до следващото
+        поколение на манифеста – candidate_pages я ползва за всеки PDF от търсенето.
+        Не я променяйте.
+        """
+        with self._lock:
+            if self._live is not None and self._live[0] == self.generation:
+                return self._live[1]
+            live = {}
+            for name, index, deleted in self.segments():
+                for file_id, entry in enumerate(index["files"]):
+                    if file_id not in deleted:
+                        live[entry["path"]] = (name, file_id)
+            self._live = (self.generation, live)
+            return live
+
+    def _write_segment(self, index):
+        self.generation += 1
+        name = f"seg-{self.generation:06d}.bin"
+        save_index(index, self.directory / name)
+        self._loaded[name] = index
+        return name
+
+    # --- запис ---
+
+    def update(self, pdf_files, cache=None, engine=DEFAULT_ENGINE):
+        """
+        Като pdf_index.update_index: изчезналите/променените файлове се отбелязват
+        като изтрити, новите/променените се индексират в един нов сегмент.
+        Файловете от сегмент, строен с друга машина (engine), се индексират наново.
+        Връща (добавени, изтрити, [(файл, грешка), ...]).
+        """
+        wanted = {str(Path(p).resolve()): Path(p).resolve() for p in pdf_files}
+        fresh = {path for path, (name, file_id) in self.live_files().items()
+                 if path in wanted and self._is_current(name, file_id, engine)}
+
+        # извличането е извън заключването – търсенето и сливането не чакат pdfminer
+        new_segment = _empty_index()
+        new_files = [pdf_file for path, pdf_file in sorted(wanted.items()) if path not in fresh]
+        added, _, errors = update_index(new_segment, new_files, cache=cache, engine=engine)
+        replaced = {f["path"] for f in new_segment["files"]}
+
+        with self._lock:
+            # живите записи се взимат наново – междувременно сливане може да е сменило сегментите
+            stale = [(name, file_id) for path, (name, file_id) in self.live_files().items()
+                     if path not in wanted or path in replaced or not self._is_current(name, file_id, engine)]
+            for name, file_id in stale:
+                self.deleted.setdefault(name, set()).add(file_id)
+            if added:
+                self.names = self.names + [self._write_segment(new_segment)]
+            if added or stale:
+                self._save_manifest()
+        return added, len(stale), errors
+
+    def _is_current(self, name, file_id, engine):
+        segment = self.segment(name)
+        if segment.get("engine") != engine:
+            return False
+        entry = segment["files"][file_id]
+        try:
+            return file_signature(entry["path"]) == (entry["size"], entry["mtime"])
+        except OSError:
+            return False
+
+    def remove(self, pdf_paths):
+        """
+        Отбелязва файловете като изтрити; връща броя им
+        """
+        paths = {str(Path(p).resolve()) for p in pdf_paths}
+        with self._lock:
+            removed = 0
+            for path, (name, file_id) in self.live_files().items():
+                if path in paths:
+                    self.deleted.setdefault(name, set()).add(file_id)
+                    removed += 1
+            if removed:
+                self._save_manifest()
+            return removed
+
+    # --- сливане ---
+
+    def merge_candidates(self, merge_factor=MERGE_FACTOR):
+        """
+        Сегментите за следващото сливане: MERGE_FACTOR сегмента от едно ниво
+        (ниво = log по основа merge_factor от броя живи файлове) или един сегмент
+        с много изтрити файлове. Празен списък – няма какво да се слива.
+        """
+        tiers = {}
+        for name, index, deleted in self.segments():
+            count = len(index["files"])
+            alive = count - len(deleted)
+            if count and (alive == 0 or len(deleted) / count > MAX_DELETED_RATIO):
+                return [name]
+            tier = int(math.log(max(alive, 1), merge_factor))
+            tiers.setdefault(tier, []).append(name)
+        for tier in sorted(tiers):
+            if len(tiers[tier]) >= merge_factor:
+                return tiers[tier][:merge_factor]
+        return []
+
+    def compact(self, names=None):
+        """
+        Слива сегментите names (по подразбиране всички) в един нов, без изтритите
+        файлове. Файлове, изтрити докато тече сливането, се отбелязват в новия сегмент.
+        """
+        with self._lock:
+            names = list(self.names) if names is None else [n for n in self.names if n in names]
+            if not names:
+                return None
+            sources = [(name, self.segment(name), set(self.deleted.get(name, ()))) for name in names]
+
+        merged = _empty_index()
+        remap = {}  # (сегмент, стар file_id) -> нов file_id
+        engines = set()
+        parts = {}  # дума -> [(сегмент, {стар file_id: нов}), ...]
+        for name, index, deleted in sources:
+            local = {}
+            for file_id, entry in enumerate(index["files"]):
+                if file_id not in deleted:
+                    local[file_id] = remap[(name, file_id)] = len(merged["files"])
+                    merged["files"].append(entry)
+            if local:
+                engines.add(index.get("engine"))
+                for term in index["postings"]:
+                    parts.setdefault(term, []).append((index, local))
+
+        # новите номера растат по реда на сегментите – постингите остават подредени;
+        # всяка дума се сглобява компресирана, без да се разкодира целият сегмент
+        def merged_terms():
+            for term, sources_of_term in parts.items():
+                data = remap_postings([(raw_postings(index["postings"], term), local)
+                                       for index, local in sources_of_term])
+                if data is not None:
+                    yield term, data
+
+        merged["postings"] = pack_postings(merged_terms())
+
+        # при сегменти от различни машини слетият няма engine и candidate_pages не подрязва по него
+        merged["engine"] = engines.pop() if len(engines) == 1 else None
+        with self._lock:
+            new_name = self._write_segment(merged) if merged["files"] else None
+            late = set()
+            for name, _, deleted in sources:
+                for file_id in self.deleted.get(name, set()) - deleted:
+                    late.add(remap[(name, file_id)])
+                self.deleted.pop(name, None)
+            if new_name and late:
+                self.deleted[new_name] = late
+
+            position = self.names.index(names[0])
+            remaining = [n for n in self.names if n not in names]
+            self.names = remaining[:position] + ([new_name] if new_name else []) + remaining[position:]
+            now = time.time()
+            expired = [name for name, since in self.retired.items() if now - since >= RETIRE_GRACE]
+            for name in expired:
+                del self.retired[name]
+            for name in names:
+                self._loaded.pop(name, None)
+                self.retired[name] = now
+            self._save_manifest()
+
+            # трият се само сегментите, слети преди повече от RETIRE_GRACE секунди
+            for name in expired:
+                (self.directory / name).unlink(missing_ok=True)
+        return new_name
+
+    def maybe_compact(self, merge_factor=MERGE_FACTOR):
+        """
+        Слива, докато merge_candidates има какво да предложи; връща броя сливания
+        """
+        merges = 0
+        while True:
+            names = self.merge_candidates(merge_factor)
+            if not names:
+                return merges
+            self.compact(names)
+            merges += 1
+
+    def compact_in_background(self, merge_factor=MERGE_FACTOR):
+        """
+        maybe_compact в отделна нишка (ако вече не тече); търсенето и update продължават
+        """
+        with self._lock:
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(target=self.maybe_compact, args=(merge_factor,), daemon=True)
+                self._compactor.start()
+            return self._compactor
+
+    # --- търсене ---
+
+    def search_index(self, keywords, whole_words=False, stem=False):
+        """
+        Като pdf_index.search_index, по всички сегменти
+        """
+        results = []
+        for name, index, deleted in self.segments():
+            live = {f["path"] for i, f in enumerate(index["files"]) if i not in deleted}
+            results.extend(r for r in search_index(index, keywords, whole_words, stem) if r["file"] in live)
+        return results
+
+    def search_query(self, query, stem=False):
+        """
+        Като query_lang.search_query, по всички сегменти
+        """
+        from query_lang import search_query
+
+        results = []
+        for name, index, deleted in self.segments():
+            live = {f["path"] for i, f in enumerate(index["files"]) if i not in deleted}
+            results.extend(r for r in search_query(index, query, stem) if r["file"] in live)
+        return results
+
+    def bm25_search(self, keywords, k=20, offset=0, whole_words=False, stem=False):
+        """
+        Като ranking.bm25_search; статистиките (брой страници, средна дължина, df)
+        са общи за всички сегменти, за да не зависи резултатът от разделянето
+        """
+        from ranking import _collection_stats, _document_frequencies, _idf, _query_terms, _scored_pages, top_k
+
+        segments = self.segments()
+        page_total = length_total = 0
+        for _, index, deleted in segments:
+            pages, length = _collection_stats(index, deleted)
+            page_total += pages
+            length_total += length
+        avg_length = length_total / page_total if page_total else 0.0
+
+        # думите от речника са различни във всеки сегмент, но df се сумира по думата от заявката
+        per_segment = []
+        df_total = {}
+        for _, index, deleted in segments:
+            groups = _query_terms(index, keywords, whole_words, stem)
+            dfs = _document_frequencies(index, [terms for _, terms in groups], deleted)
+            for (word, _), df in zip(groups, dfs):
+                df_total[word] = df_total.get(word, 0) + df
+            per_segment.append(groups)
+
+        def scored():
+            for seg_pos, (_, index, deleted) in enumerate(segments):
+                groups = per_segment[seg_pos]
+                idf = [_idf(df_total[word], page_total) for word, _ in groups]
+                for score, file_id, page in _scored_pages(index, [t for _, t in groups], idf, avg_length, skip=deleted):
+                    yield score, -seg_pos, -file_id, -page
+
+        ranked, total = top_k(scored(), offset + k)
+        return {
+            "total": total,
+            "offset": offset,
+            "results": [
+                {"file": segments[-neg_seg][1]["files"][-neg_file]["path"], "page": -neg_page, "score": score}
+                for score, neg_seg, neg_file, neg_page in ranked[offset:offset + k]
+            ],
+        }
+
+    def candidate_pages(self, pdf_path, keywords, stem=False, engine=None):
+        """
+        Като pdf_index.candidate_pages – търси се само в сегмента с живия запис на файла
+        """
+        found = self.live_files().get(str(Path(pdf_path).resolve()))
+        if found is None:
+            return None
+        return candidate_pages(self.segment(found[0]), pdf_path, keywords, stem=stem, engine=engine)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from extract_engines import ENGINES
+
+    parser = argparse.ArgumentParser(description="Segmented (LSM-style) PDF index: update, compact and query.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_update = sub.add_parser("update", help="index new/changed PDFs into a fresh segment, mark deleted ones")
+    p_update.add_argument("directory", help="directory with PDF files")
+    p_update.add_argument("--segments", help=f"segment directory (default: <directory>/{DEFAULT_SEGMENTS_NAME})")
+    p_update.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE, help=f"text extraction engine (default {DEFAULT_ENGINE})")
+    p_update.add_argument("--no-compact", action="store_true", help="skip the merge step after updating")
+
+    p_compact = sub.add_parser("compact", help="merge all segments into one and drop deleted files")
+    p_compact.add_argument("segments", help="segment directory")
+
+    p_search = sub.add_parser("search", help="query all segments")
+    p_search.add_argument("segments", help="segment directory")
+    p_search.add_argument("keywords", nargs="+", help="keywords or quoted phrases")
+    p_search.add_argument("--rank", action="store_true", help="BM25-ranked pages instead of all matches")
+    p_search.add_argument("-k", "--top", type=int, default=20, help="ranked results to show (default 20)")
+    p_search.add_argument("--stem", action="store_true", help="match Bulgarian word forms by stem")
+
+    args = parser.parse_args()
+
+    if args.command == "update":
+        directory = Path(args.directory)
+        store = SegmentedIndex(args.segments or directory / DEFAULT_SEGMENTS_NAME)
+        added, removed, errors = store.update(sorted(directory.glob("*.pdf")), engine=args.engine)
+        for path, error in errors:
+            print(f"⚠️ Грешка ({Path(path).name}): {error}")
+        merges = 0 if args.no_compact else store.maybe_compact()
+        print(f"Добавени/обновени: {added}, изтрити: {removed}, сливания: {merges}, сегменти: {len(store.names)}")
+    elif args.command == "compact":
+        store = SegmentedIndex(args.segments)
+        store.compact()
+        print(f"Сегменти: {len(store.names)}")
+    else:
+        store = SegmentedIndex(args.segments)
+        if args.rank:
+            response = store.bm25_search(args.keywords, k=args.top, stem=args.stem)
+            print(f"Страници със съвпадение: {response['total']}")
+            for r in response["results"]:
+                print(f"{r['score']:8.3f}\t{Path(r['file']).name}\tстр. {r['page']}")
+        else:
+            for r in store.search_index(args.keywords, stem=args.stem):
+                print(f"{Path(r['file']).name}\tстр. {r['page']}\t{r['keyword']}")
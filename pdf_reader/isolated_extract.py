@@ -0,0 +1,120 @@
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE
+
+DEFAULT_TIMEOUT = 600  # секунди на файл
+DEFAULT_MAX_MEMORY = 4 * 1024 ** 3  # 4 GB адресно пространство
+
+# Признаци в stderr на детето, че е ударило лимита на паметта
+MEMORY_ERRORS = ("MemoryError", "Cannot allocate memory", "failed to map segment")
+
+# Ограничението на паметта (RLIMIT_AS) е само за POSIX; под Windows важи само времето
+try:
+    import resource
+    HAS_RLIMIT = True
+except ImportError:
+    resource = None
+    HAS_RLIMIT = False
+
+
+class BudgetExceeded(Exception):
+    """
+    Файлът надхвърли бюджета (време/памет) или процесът за извличане се провали
+    """
+
+    def __init__(self, pdf_path, reason, detail="", seconds=0.0):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.pdf_path = str(pdf_path)
+        self.reason = reason
+        self.detail = detail
+        self.seconds = seconds
+
+    def to_dict(self):
+        return {"file": self.pdf_path, "reason": self.reason, "detail": self.detail, "seconds": self.seconds}
+
+
+def _limit_memory(max_memory):
+    def apply():
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    return apply
+
+
+class IsolatedExtractor:
+    """
+    Извлича текста на всеки файл в отделен процес с лимит на времето
+    (timeout) и на адресното пространство (max_memory). Използва се вместо
+    extract_text_by_page (iter_search(..., extractor=IsolatedExtractor())).
+    Файловете извън бюджета предизвикват BudgetExceeded и се записват в skipped.
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, max_memory=DEFAULT_MAX_MEMORY):
+        self.timeout = timeout
+        self.max_memory = max_memory
+        self.skipped = []
+
+    def __call__(self, pdf_path, pages=None, engine=DEFAULT_ENGINE, timings=None):
+        return self.text_by_page(pdf_path, pages=pages, engine=engine)
+
+    def text_by_page(self, pdf_path, pages=None, engine=DEFAULT_ENGINE):
+        """
+        Като extract_text_by_page; страниците се връщат едва след като детето
+        приключи успешно, за да не се търси в частично извлечен файл.
+        Времената по етапи (timings) от детския процес не се събират.
+        """
+        cmd = [sys.executable, str(Path(__file__).resolve()), str(pdf_path), "--engine", engine]
+        if pages is not None:
+            cmd += ["--pages", ",".join(str(p) for p in sorted(set(pages)))]
+
+        preexec_fn = _limit_memory(self.max_memory) if HAS_RLIMIT and self.max_memory else None
+        t0 = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=preexec_fn)
+        try:
+            out, err = proc.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            self._fail(pdf_path, "timeout", f"> {self.timeout} s", time.perf_counter() - t0)
+
+        seconds = time.perf_counter() - t0
+        if proc.returncode != 0:
+            stderr = err.decode("utf-8", "replace").strip()
+            detail = stderr.splitlines()[-1] if stderr else f"exit code {proc.returncode}"
+            reason = "memory" if any(m in stderr for m in MEMORY_ERRORS) else "error"
+            self._fail(pdf_path, reason, detail, seconds)
+
+        for line in out.decode("utf-8").splitlines():
+            page_number, text = json.loads(line)
+            yield page_number, text
+
+    def _fail(self, pdf_path, reason, detail, seconds):
+        error = BudgetExceeded(pdf_path, reason, detail, seconds)
+        self.skipped.append(error.to_dict())
+        raise error
+
+    def write_report(self, path):
+        """
+        Записва пропуснатите файлове като JSON
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.skipped, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    # Детски процес: извлича един файл и пише [page_number, text] като JSON редове в stdout
+    import argparse
+
+    from pdf_reader import extract_text_by_page, parse_pages
+
+    parser = argparse.ArgumentParser(description="Extract page text of one PDF as JSON lines (used by IsolatedExtractor).")
+    parser.add_argument("pdf", help="PDF file")
+    parser.add_argument("--engine", default=DEFAULT_ENGINE, help="text extraction engine")
+    parser.add_argument("--pages", type=parse_pages, default=None, help="only these pages, e.g. '1-30,45'")
+    args = parser.parse_args()
+
+    out = sys.stdout.buffer
+    for page_number, text in extract_text_by_page(args.pdf, pages=args.pages, engine=args.engine):
+        out.write(json.dumps([page_number, text], ensure_ascii=False).encode("utf-8") + b"\n")
@@ -0,0 +1,135 @@
+from collections import deque
+
+# Optional C implementation of the automaton
+HAS_AHOCORASICK = False
+try:
+    import ahocorasick  # type: ignore
+    HAS_AHOCORASICK = True
+except Exception:
+    ahocorasick = None
+    HAS_AHOCORASICK = False
+
+
+def fold_case(text):
+    """
+    Връща (text.lower(), offset_map). offset_map е None, ако дължината не се
+    променя; иначе за всеки символ от сгънатия текст пази позицията в оригинала.
+    """
+    folded = text.lower()
+    if len(folded) == len(text):
+        return folded, None
+
+    parts = []
+    offset_map = []
+    for i, ch in enumerate(text):
+        low = ch.lower()
+        parts.append(low)
+        offset_map.extend([i] * len(low))
+    offset_map.append(len(text))
+    return "".join(parts), offset_map
+
+
+class KeywordMatcher:
+    """
+    Автомат на Ахо–Корасик за много ключови думи наведнъж (без значение от
+    регистъра). Строи се веднъж за заявка; всяка страница се сгъва (lower)
+    веднъж и се обхожда с един проход.
+    """
+
+    def __init__(self, keywords, patterns=None):
+        """
+        patterns: по желание – какво да се търси за всяка ключова дума (напр. основата ѝ);
+        срещанията се отчитат под оригиналната ключова дума
+        """
+        self.keywords = list(keywords)
+        patterns = self.keywords if patterns is None else list(patterns)
+        # сгъната дума -> индекси на оригиналните ключови думи
+        self._patterns = {}
+        for i, pattern in enumerate(patterns):
+            if pattern:
+                self._patterns.setdefault(pattern.lower(), []).append(i)
+
+        if HAS_AHOCORASICK:
+            self._automaton = ahocorasick.Automaton()
+            for pattern, kw_ids in self._patterns.items():
+                self._automaton.add_word(pattern, (len(pattern), kw_ids))
+            if self._patterns:
+                self._automaton.make_automaton()
+        else:
+            self._build()
+
+    def _build(self):
+        goto = [{}]
+        out = [[]]
+
+        for pattern, kw_ids in self._patterns.items():
+            state = 0
+            for ch in pattern:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    goto.append({})
+                    out.append([])
+                    nxt = len(goto) - 1
+                    goto[state][ch] = nxt
+                state = nxt
+            out[state].append((len(pattern), kw_ids))
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self._goto = goto
+        self._fail = fail
+        self._out = out
+
+    def _iter_folded(self, folded):
+        """
+        (край, (дължина, kw_ids)) за всяко срещане в вече сгънат текст
+        """
+        if not self._patterns:
+            return
+
+        if HAS_AHOCORASICK:
+            for end, payload in self._automaton.iter(folded):
+                yield end + 1, payload
+            return
+
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(folded):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for payload in out[state]:
+                    yield i + 1, payload
+
+    def finditer(self, text):
+        """
+        Генератор: (start, end, keyword) за всяко срещане (и застъпващите се)
+        по реда на края им; отместванията са в оригиналния text
+        """
+        folded, offset_map = fold_case(text)
+        for end, (length, kw_ids) in self._iter_folded(folded):
+            start = end - length
+            if offset_map is not None:
+                start, end = offset_map[start], offset_map[end]
+            for kw_id in kw_ids:
+                yield start, end, self.keywords[kw_id]
+
+    def find_all(self, text):
+        """
+        {keyword: [(start, end), ...]} – всички срещания на всяка намерена ключова дума
+        """
+        found = {}
+        for start, end, kw in self.finditer(text):
+            found.setdefault(kw, []).append((start, end))
+        return found
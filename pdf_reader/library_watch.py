@@ -0,0 +1,257 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE
+from pdf_index import DEFAULT_INDEX_NAME, INDEX_VERSION, file_signature, load_index, save_index, update_index
+
+DEFAULT_POLL_INTERVAL = 5.0  # секунди между две проверки на папката без inotify
+DEFAULT_QUIET = 2.0  # изчаква толкова секунди без нови събития, преди да обнови индекса
+
+# inotify през libc (само Linux); без него папката се проверява периодично
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+_libc = None
+HAS_INOTIFY = False
+if sys.platform.startswith("linux"):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        HAS_INOTIFY = hasattr(_libc, "inotify_init1")
+    except OSError:
+        _libc = None
+
+
+class InotifyWatcher:
+    """
+    Събития за *.pdf в една папка (записан, преместен, изтрит файл) чрез inotify
+    """
+
+    def __init__(self, directory):
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+        if _libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch {directory}")
+
+    def close(self):
+        os.close(self.fd)
+
+    def wait(self, timeout=None):
+        """
+        Чака до timeout секунди; връща имената на променените PDF файлове (може и празно)
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                _, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                name = os.fsdecode(data[pos:pos + length].rstrip(b"\0"))
+                pos += length
+                if mask & IN_DELETE_SELF:
+                    raise FileNotFoundError("Наблюдаваната папка е изтрита")
+                if name.lower().endswith(".pdf"):
+                    names.add(name)
+        return names
+
+
+class PollingWatcher:
+    """
+    Резервен вариант без inotify: сравнява (размер, mtime) на *.pdf през interval секунди
+    """
+
+    def __init__(self, directory, interval=DEFAULT_POLL_INTERVAL):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.snapshot = self._scan()
+
+    def close(self):
+        pass
+
+    def _scan(self):
+        result = {}
+        for path in self.directory.glob("*.pdf"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            result[path.name] = (st.st_size, st.st_mtime_ns)
+        return result
+
+    def wait(self, timeout=None):
+        time.sleep(self.interval if timeout is None else min(self.interval, timeout))
+        snapshot = self._scan()
+        changed = {name for name in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(name) != self.snapshot.get(name)}
+        self.snapshot = snapshot
+        return changed
+
+
+def make_watcher(directory, poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+    if HAS_INOTIFY and not polling:
+        try:
+            return InotifyWatcher(directory)
+        except OSError:
+            pass  # напр. изчерпан лимит на inotify – минаваме на проверка през интервал
+    return PollingWatcher(directory, poll_interval)
+
+
+def _pdf_files(directory, failed=None):
+    """
+    *.pdf в папката без файловете, които вече са дали грешка и не са променяни
+    """
+    pdf_files = []
+    for pdf_file in sorted(Path(directory).glob("*.pdf")):
+        pdf_file = pdf_file.resolve()
+        try:
+            if failed is not None and failed.get(str(pdf_file)) == file_signature(pdf_file):
+                continue
+        except OSError:
+            continue
+        pdf_files.append(pdf_file)
+    return pdf_files
+
+
+def _remember_failures(failed, errors):
+    if failed is None:
+        return
+    for path, _ in errors:
+        try:
+            failed[path] = file_signature(path)
+        except OSError:
+            pass
+
+
+def sync_index(directory, index_path=None, cache=None, engine=DEFAULT_ENGINE, failed=None):
+    """
+    Един проход: зарежда индекса (или започва нов), обновява го по текущите *.pdf
+    и го записва, ако има промени. Връща (добавени, изтрити, грешки).
+    failed: по желание речник път -> (размер, mtime) на файлове с грешка; те не се
+    опитват отново, докато не се променят
+    """
+    directory = Path(directory)
+    index_path = Path(index_path) if index_path else directory / DEFAULT_INDEX_NAME
+    index = load_index(index_path) or {"version": INDEX_VERSION, "files": [], "postings": {}}
+
+    added, removed, errors = update_index(index, _pdf_files(directory, failed), cache=cache, engine=engine)
+    if added or removed or not index_path.exists():
+        save_index(index, index_path)
+    _remember_failures(failed, errors)
+    return added, removed, errors
+
+
+def sync_segments(segments, directory, cache=None, engine=DEFAULT_ENGINE, failed=None):
+    """
+    Като sync_index, но в SegmentedIndex: новите файлове отиват в нов сегмент,
+    а сливането тече във фонова нишка
+    """
+    added, removed, errors = segments.update(_pdf_files(directory, failed), cache=cache, engine=engine)
+    _remember_failures(failed, errors)
+    segments.compact_in_background()
+    return added, removed, errors
+
+
+def watch(directory, index_path=None, cache=None, engine=DEFAULT_ENGINE, quiet=DEFAULT_QUIET,
+          poll_interval=DEFAULT_POLL_INTERVAL, polling=False, on_update=None, segments=False):
+    """
+    Следи папката и поддържа индекса актуален: след всяка серия от промени
+    (и quiet секунди тишина – докато файлът се сваля) индексира само новите/променените
+    PDF-и и маха изтритите. on_update(added, removed, errors) се вика след всяко обновяване.
+    segments: индексът е SegmentedIndex (index_segments.py) в index_path
+    (по подразбиране <папка>/.pdf_segments). Върти се до KeyboardInterrupt.
+    """
+    report = on_update or (lambda *result: None)
+    failed = {}
+    if segments:
+        from index_segments import DEFAULT_SEGMENTS_NAME, SegmentedIndex
+
+        store = SegmentedIndex(index_path or Path(directory) / DEFAULT_SEGMENTS_NAME)
+
+        def sync():
+            return sync_segments(store, directory, cache, engine, failed)
+    else:
+        def sync():
+            return sync_index(directory, index_path, cache, engine, failed)
+
+    report(*sync())
+    watcher = make_watcher(directory, poll_interval, polling)
+    try:
+        while True:
+            if not watcher.wait():
+                continue
+            # изчакваме серията от събития да утихне
+            while watcher.wait(quiet):
+                pass
+            report(*sync())
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from extract_engines import ENGINES
+
+    parser = argparse.ArgumentParser(description="Keep the PDF index of a directory up to date as files are added, changed or deleted.")
+    parser.add_argument("directory", help="directory with PDF files")
+    parser.add_argument("--index", help=f"index file, or segment directory with --segments (default: <directory>/{DEFAULT_INDEX_NAME})")
+    parser.add_argument("--segments", action="store_true", help="keep a segmented index (index_segments.py) with background compaction")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE, help=f"text extraction engine (default {DEFAULT_ENGINE})")
+    parser.add_argument("--quiet", type=float, default=DEFAULT_QUIET, help="seconds without new events before re-indexing")
+    parser.add_argument("--interval", type=float, default=DEFAULT_POLL_INTERVAL, help="polling interval in seconds when inotify is unavailable")
+    parser.add_argument("--poll", action="store_true", help="always poll instead of using inotify")
+    parser.add_argument("--once", action="store_true", help="update the index once and exit")
+    parser.add_argument("--cache", action="store_true", help="read/write page text through the page cache")
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache:
+        from page_cache import PageCache
+        cache = PageCache()
+
+    def on_update(added, removed, errors):
+        for path, error in errors:
+            print(f"⚠️ Грешка ({Path(path).name}): {error}", flush=True)
+        print(f"{time.strftime('%H:%M:%S')} добавени/обновени: {added}, изтрити: {removed}", flush=True)
+
+    if args.once and args.segments:
+        from index_segments import DEFAULT_SEGMENTS_NAME, SegmentedIndex
+
+        store = SegmentedIndex(args.index or Path(args.directory) / DEFAULT_SEGMENTS_NAME)
+        on_update(*store.update(_pdf_files(args.directory), cache=cache, engine=args.engine))
+        store.maybe_compact()
+    elif args.once:
+        on_update(*sync_index(args.directory, args.index, cache, args.engine))
+    else:
+        mode = "inotify" if HAS_INOTIFY and not args.poll else f"проверка на всеки {args.interval} s"
+        print(f"👀 Следене на {args.directory} ({mode}), Ctrl+C за край", flush=True)
+        try:
+            watch(args.directory, args.index, cache, args.engine, quiet=args.quiet,
+                  poll_interval=args.interval, polling=args.poll, on_update=on_update, segments=args.segments)
+        except KeyboardInterrupt:
+            pass
+        except FileNotFoundError as e:
+            print(f"⚠️ {e}")
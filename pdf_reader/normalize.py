@@ -0,0 +1,50 @@
+import re
+import unicodedata
+
+SOFT_HYPHEN = "\u00ad"
+
+LIGATURES = {
+    "ﬀ": "ff",
+    "ﬁ": "fi",
+    "ﬂ": "fl",
+    "ﬃ": "ffi",
+    "ﬄ": "ffl",
+    "ﬅ": "st",
+    "ﬆ": "st",
+}
+LIGATURE_TABLE = str.maketrans({SOFT_HYPHEN: "", **LIGATURES})
+
+# Пренесена дума: "без-\nдна" -> "бездна" (тирето в края на реда, буква на следващия)
+LINE_HYPHEN_RE = re.compile(r"(\w)[-\u2010\u2011][ \t]*\n\s*(\w)")
+
+CYRILLIC_WORD_RE = re.compile(r"^[а-яёѝ]+$")
+
+# Окончания (членувани форми, множествено число, прилагателни), най-дългите първи.
+# Лек стемер: маха едно окончание, ако остават поне MIN_STEM букви.
+BG_SUFFIXES = sorted([
+    "ищата", "овете", "евете", "ията", "ият", "ите", "ата", "ята", "ото", "ето",
+    "ове", "еве", "ища", "ия", "ът", "ят", "те",
+    "а", "я", "о", "е", "и", "ъ",
+], key=len, reverse=True)
+MIN_STEM = 3
+
+
+def normalize_text(text):
+    """
+    Unicode NFC, без меки тирета и лигатури, пренесените в края на реда думи се сливат
+    """
+    text = unicodedata.normalize("NFC", text).translate(LIGATURE_TABLE)
+    return LINE_HYPHEN_RE.sub(r"\1\2", text)
+
+
+def stem_bg(word):
+    """
+    Лек стемер за български: "бездна", "бездната", "бездни" -> "бездн".
+    Думи, които не са изцяло на кирилица, се връщат без промяна.
+    """
+    if not CYRILLIC_WORD_RE.match(word):
+        return word
+    for suffix in BG_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            return word[:-len(suffix)]
+    return word
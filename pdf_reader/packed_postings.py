@@ -0,0 +1,277 @@
+import json
+import struct
+from array import array
+from collections.abc import MutableMapping
+
+# Двоичен формат на индекса:
+#   MAGIC, дължина (uint32) + заглавие (JSON: всичко без постингите), дължина (uint32) + речник
+#   (JSON списък), отмествания array('Q') – len(terms) + 1 числа, после постингите на всички думи.
+# Постингите на една дума: брой записи, после за всеки запис
+#   разлика във file_id, страница (разлика спрямо предишната, ако файлът е същият), брой позиции,
+#   позициите като разлики – всичко като varint (7 бита на байт, старшият бит = "има още").
+MAGIC = b"PDFIDX2\n"
+HEADER = struct.Struct("<I")
+
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, i):
+    value = shift = 0
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+
+def encode_postings(entries):
+    """
+    [[file_id, page, [позиции]], ...] (подредени по file_id, page) -> bytes
+    """
+    out = bytearray()
+    _put_varint(out, len(entries))
+    prev_file = prev_page = 0
+    for file_id, page, positions in entries:
+        _put_varint(out, file_id - prev_file)
+        _put_varint(out, page - prev_page if file_id == prev_file else page)
+        prev_file, prev_page = file_id, page
+        _put_varint(out, len(positions))
+        prev_pos = 0
+        for pos in positions:
+            _put_varint(out, pos - prev_pos)
+            prev_pos = pos
+    return bytes(out)
+
+
+def decode_postings(data):
+    """
+    Обратното на encode_postings
+    """
+    values = []
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+
+    entries = []
+    i = 1
+    file_id = page = 0
+    for _ in range(values[0] if values else 0):
+        delta_file, page_value, count = values[i], values[i + 1], values[i + 2]
+        i += 3
+        page = page + page_value if delta_file == 0 else page_value
+        file_id += delta_file
+        positions = []
+        pos = 0
+        for delta in values[i:i + count]:
+            pos += delta
+            positions.append(pos)
+        i += count
+        entries.append([file_id, page, positions])
+    return entries
+
+
+def _walk(data):
+    """
+    (file_id, начало на страницата, край на записа) за всеки запис в компресираните постинги
+    """
+    count, i = _read_varint(data, 0)
+    file_id = 0
+    for _ in range(count):
+        delta, i = _read_varint(data, i)
+        file_id += delta
+        page_start = i
+        _, i = _read_varint(data, i)
+        positions, i = _read_varint(data, i)
+        for _ in range(positions):
+            _, i = _read_varint(data, i)
+        yield file_id, page_start, i
+
+
+def remap_postings(parts):
+    """
+    Компресираните постинги на една дума от един или няколко индекса: parts е
+    [(байтове, {стар file_id: нов file_id}), ...], подредени така, че новите file_id растат.
+    Записите на файловете извън remap отпадат. Страницата и позициите на всеки запис се
+    копират като байтове – пренаписва се само разликата във file_id; дума от един индекс,
+    чиито file_id не се менят, се връща както е. None, ако не остане нито един запис.
+    """
+    if len(parts) == 1:
+        data, remap = parts[0]
+        if all(remap.get(file_id) == file_id for file_id, _, _ in _walk(data)):
+            return data
+
+    out = bytearray()
+    count = prev = 0
+    for data, remap in parts:
+        for file_id, page_start, end in _walk(data):
+            new_id = remap.get(file_id)
+            if new_id is not None:
+                _put_varint(out, new_id - prev)
+                out += data[page_start:end]
+                prev = new_id
+                count += 1
+    if not count:
+        return None
+    head = bytearray()
+    _put_varint(head, count)
+    return bytes(head + out)
+
+
+def pack_postings(pairs):
+    """
+    PackedPostings от (дума, компресирани байтове) – без разкодиране
+    """
+    terms = []
+    offsets = array("Q", [0])
+    blob = bytearray()
+    for term, data in pairs:
+        terms.append(term)
+        blob += data
+        offsets.append(len(blob))
+    return PackedPostings(terms, offsets, memoryview(blob))
+
+
+def raw_postings(postings, term):
+    """
+    Компресираните байтове на думата – копие от PackedPostings или кодирани наново
+    """
+    data = postings.raw(term) if isinstance(postings, PackedPostings) else None
+    return encode_postings(postings[term]) if data is None else data
+
+
+class PackedPostings(MutableMapping):
+    """
+    Речник дума -> постинги, който държи постингите компресирани (blob + array от
+    отмествания) и ги разкодира едва при достъп до думата. Обхождането на речника
+    (напр. търсене на подниз в думите) не разкодира нищо.
+    Записът е през setdefault (както в pdf_index): променените думи се пазят разкодирани.
+    """
+
+    def __init__(self, terms, offsets, blob):
+        self.terms = terms
+        self.offsets = offsets
+        self.blob = blob
+        self._ids = {term: i for i, term in enumerate(terms)}
+        self._changed = {}
+        self._removed = set()
+
+    def raw(self, term):
+        """
+        Компресираните байтове на думата (None, ако е променена)
+        """
+        if term in self._changed or term in self._removed:
+            return None
+        i = self._ids[term]
+        return self.blob[self.offsets[i]:self.offsets[i + 1]]
+
+    def __getitem__(self, term):
+        changed = self._changed.get(term)
+        if changed is not None:
+            return changed
+        if term in self._removed or term not in self._ids:
+            raise KeyError(term)
+        return decode_postings(self.raw(term))
+
+    def __contains__(self, term):
+        return term in self._changed or (term in self._ids and term not in self._removed)
+
+    def __setitem__(self, term, entries):
+        self._changed[term] = entries
+        self._removed.discard(term)
+
+    def setdefault(self, term, default=None):
+        if term not in self._changed:
+            self._changed[term] = self[term] if term in self else default
+            self._removed.discard(term)
+        return self._changed[term]
+
+    def __delitem__(self, term):
+        if term not in self:
+            raise KeyError(term)
+        self._changed.pop(term, None)
+        if term in self._ids:
+            self._removed.add(term)
+
+    def __iter__(self):
+        for term in self.terms:
+            if term not in self._removed:
+                yield term
+        for term in self._changed:
+            if term not in self._ids:
+                yield term
+
+    def __len__(self):
+        return len(self.terms) - len(self._removed) + sum(1 for t in self._changed if t not in self._ids)
+
+
+def write_packed(index, path):
+    """
+    Записва индекса в двоичния формат (без ключовете, започващи с "_")
+    """
+    postings = index["postings"]
+    terms = list(postings)
+    offsets = array("Q", [0])
+    with open(path, "wb") as f:
+        header = {k: v for k, v in index.items() if k != "postings" and not k.startswith("_")}
+        f.write(MAGIC)
+        for block in (header, terms):
+            data = json.dumps(block, ensure_ascii=False).encode("utf-8")
+            f.write(HEADER.pack(len(data)) + data)
+
+        blobs = []
+        for term in terms:
+            # непроменените думи се копират компресирани, без разкодиране
+            blobs.append(raw_postings(postings, term))
+            offsets.append(offsets[-1] + len(blobs[-1]))
+        offsets.tofile(f)
+        for data in blobs:
+            f.write(data)
+
+
+def read_header(path):
+    """
+    Само заглавието на индекса (без речника и постингите) или None
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            return None
+        (header_size,) = HEADER.unpack(f.read(HEADER.size))
+        return json.loads(f.read(header_size))
+
+
+def read_packed(path):
+    """
+    Зарежда индекс в двоичния формат; постингите са PackedPostings.
+    None, ако файлът не е в този формат.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        return None
+
+    pos = len(MAGIC)
+    blocks = []
+    for _ in range(2):
+        (size,) = HEADER.unpack_from(data, pos)
+        pos += HEADER.size
+        blocks.append(json.loads(data[pos:pos + size]))
+        pos += size
+
+    index, terms = blocks
+    offsets = array("Q")
+    offsets.frombytes(data[pos:pos + (len(terms) + 1) * offsets.itemsize])
+    pos += len(offsets) * offsets.itemsize
+    index["postings"] = PackedPostings(terms, offsets, memoryview(data)[pos:])
+    return index
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE, ENGINES
+from pdf_reader import extract_text_by_page
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "pdf_reader" / "pages"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+# Сменя се при промяна в начина на извличане – старите записи стават невалидни
+EXTRACTION_SETTINGS = {"laparams": "default", "version": 1}
+
+
+def file_hash(pdf_path, chunk_size=1024 * 1024):
+    """
+    SHA-256 на съдържанието на файла
+    """
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def settings_key(settings):
+    """
+    Кратък ключ за настройките на извличане
+    """
+    raw = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+class PageCache:
+    """
+    Дисков кеш на текста по страници, адресиран по хеша на PDF съдържанието.
+    Записът е JSONL файл (по един ред на страница) и се чете поточно,
+    без pdfminer. При надвишаване на max_bytes се трият най-отдавна ползваните.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, settings=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.settings = settings if settings is not None else EXTRACTION_SETTINGS
+        # (размер, mtime, хеш) на всеки PDF е в отделен малък файл – процесите, които
+        # пишат едновременно (parallel_search), не презаписват чуждите записи
+        self._stat_dir = self.cache_dir / "stat"
+        self._stat_dir.mkdir(exist_ok=True)
+        self._stat = {}
+
+    def _stat_path(self, pdf_path):
+        return self._stat_dir / f"{hashlib.sha1(str(pdf_path).encode('utf-8')).hexdigest()}.json"
+
+    def _load_stat(self, pdf_path):
+        try:
+            with open(self._stat_path(pdf_path), encoding="utf-8") as f:
+                path, *known = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return known if path == str(pdf_path) else None
+
+    def _save_stat(self, pdf_path, known):
+        stat_path = self._stat_path(pdf_path)
+        tmp_path = stat_path.with_name(f"{stat_path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump([str(pdf_path), *known], f, ensure_ascii=False)
+        os.replace(tmp_path, stat_path)
+
+    def content_hash(self, pdf_path):
+        """
+        Хеш на файла; при същите размер и mtime се взема наготово, без повторно четене
+        """
+        pdf_path = Path(pdf_path).resolve()
+        st = os.stat(pdf_path)
+        known = self._stat.get(str(pdf_path)) or self._load_stat(pdf_path)
+        if known and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            self._stat[str(pdf_path)] = known
+            return known[2]
+
+        digest = file_hash(pdf_path)
+        known = self._stat[str(pdf_path)] = [st.st_size, st.st_mtime_ns, digest]
+        self._save_stat(pdf_path, known)
+        return digest
+
+    def key(self, engine=DEFAULT_ENGINE):
+        """
+        Ключ на настройките за дадена машина за извличане
+        """
+        return settings_key({**self.settings, "engine": engine})
+
+    def entry_path(self, digest, engine=DEFAULT_ENGINE):
+        return self.cache_dir / f"{digest}.{self.key(engine)}.jsonl"
+
+    def bloom_path(self, entry):
+        return entry.with_suffix(".bloom")
+
+    def bloom(self, pdf_path, engine=DEFAULT_ENGINE):
+        """
+        DocumentBloom (bloom_filter.py) на файла или None, ако още не е извличан
+        """
+        from bloom_filter import DocumentBloom
+
+        path = self.bloom_path(self.entry_path(self.content_hash(pdf_path), engine))
+        try:
+            return DocumentBloom.load(path)
+        except (OSError, ValueError):
+            return None
+
+    def text_by_page(self, pdf_path, pages=None, engine=DEFAULT_ENGINE, timings=None, extractor=None):
+        """
+        Като extract_text_by_page, но от кеша, ако има запис.
+        При липса извлича целия файл и го записва, докато връща страниците;
+        заедно със записа се строи и Bloom филтърът на файла (виж bloom()).
+        timings се подава на extract_text_by_page (попаденията в кеша не се мерят);
+        extractor: по желание заместител на extract_text_by_page при липса в кеша.
+        """
+        extract = extractor or extract_text_by_page
+        entry = self.entry_path(self.content_hash(pdf_path), engine)
+
+        if entry.exists():
+            os.utime(entry)  # LRU: отбелязва последно ползване
+            yield from self._read_entry(entry, pages)
+            return
+
+        if pages is not None:
+            # Частично извличане не се кешира
+            yield from extract(pdf_path, pages=pages, engine=engine, timings=timings)
+            return
+
+        from bloom_filter import DocumentBloom
+
+        tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        bloom = DocumentBloom()
+        complete = False
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for page_number, text in extract(pdf_path, engine=engine, timings=timings):
+                    f.write(json.dumps(text, ensure_ascii=False) + "\n")
+                    bloom.add_page(page_number, text)
+                    yield page_number, text
+            complete = True
+        finally:
+            if complete:
+                # филтърът се записва преди записа, за да няма запис без филтър
+                bloom_tmp = tmp_path.with_suffix(".bloom.tmp")
+                bloom.finish().save(bloom_tmp)
+                os.replace(bloom_tmp, self.bloom_path(entry))
+                os.replace(tmp_path, entry)
+                self.evict()
+            else:
+                tmp_path.unlink(missing_ok=True)
+
+    def _read_entry(self, entry, pages=None):
+        if pages is not None and not pages:
+            return
+        wanted = set(pages) if pages is not None else None
+        last = max(wanted) if wanted else None
+        with open(entry, encoding="utf-8") as f:
+            for page_number, line in enumerate(f, start=1):
+                if wanted is not None:
+                    if page_number > last:
+                        break
+                    if page_number not in wanted:
+                        continue
+                yield page_number, json.loads(line)
+
+    def evict(self):
+        """
+        Трие най-стари записи (по време на ползване), докато общият размер стане <= max_bytes
+        """
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*.jsonl"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.bloom_path(path).unlink(missing_ok=True)
+            total -= size
+
+    def invalidate(self, pdf_path=None):
+        """
+        Без аргумент: трие записите, направени с други настройки на извличане.
+        С pdf_path: трие всички записи за този файл.
+        """
+        if pdf_path is None:
+            current = {self.key(engine) for engine in ENGINES}
+            for path in self.cache_dir.glob("*.*.*"):
+                if path.suffix in (".jsonl", ".bloom") and path.name.split(".")[1] not in current:
+                    path.unlink(missing_ok=True)
+            return
+
+        digest = self.content_hash(pdf_path)
+        for pattern in (f"{digest}.*.jsonl", f"{digest}.*.bloom"):
+            for path in self.cache_dir.glob(pattern):
+                path.unlink(missing_ok=True)
+
+    def clear(self):
+        """
+        Изчиства целия кеш
+        """
+        for pattern in ("*.jsonl", "*.bloom"):
+            for path in self.cache_dir.glob(pattern):
+                path.unlink(missing_ok=True)
+        for path in self._stat_dir.glob("*.json"):
+            path.unlink(missing_ok=True)
+        (self.cache_dir / "stat.json").unlink(missing_ok=True)  # стар общ файл
+        self._stat = {}
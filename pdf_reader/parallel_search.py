@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE, ENGINES
+from pdf_reader import index_pages, search_in_pdf
+from search_timing import SearchTimings
+
+DEFAULT_MAX_TASKS_PER_CHILD = 20
+
+# Състояние на работния процес (зарежда се веднъж от _init_worker)
+_worker_cache = None
+_worker_corpus = None
+
+
+def _init_worker(cache_dir, corpus_path=None):
+    global _worker_cache, _worker_corpus
+    if corpus_path:
+        from corpus_store import CorpusStore
+        _worker_corpus = CorpusStore(corpus_path)
+    if cache_dir:
+        from page_cache import PageCache
+        _worker_cache = PageCache(cache_dir)
+
+
+def _search_file(task):
+    pdf_file, options, with_timings = task
+    timings = SearchTimings() if with_timings else None
+    if _worker_corpus is not None:
+        options = dict(options, extractor=_worker_corpus)
+    try:
+        results = search_in_pdf(pdf_file, cache=_worker_cache, timings=timings, **options)
+        error = None
+    except Exception as e:
+        results, error = [], f"{type(e).__name__}: {e}"
+    return pdf_file, results, error, timings.records() if timings else None
+
+
+def _largest_first(pdf_files):
+    """
+    Подрежда файловете по размер (най-големите първи). Само stat, без отваряне
+    на PDF-ите – иначе първият резултат чака последователен разбор на цялата библиотека.
+    """
+    def weight(pdf_file):
+        try:
+            return os.path.getsize(pdf_file)
+        except OSError:
+            return 0
+
+    return sorted(pdf_files, key=weight, reverse=True)
+
+
+def _indexed_options(pdf_files, index_path, search_options):
+    """
+    {файл: search_options с pages = страниците-кандидати от индекса}. Индексът се
+    зарежда веднъж тук, в главния процес – работните процеси се сменят на всеки
+    max_tasks_per_child файла и иначе биха го зареждали наново всеки път.
+    """
+    keywords = search_options.get("keywords")
+    if not index_path or not keywords or search_options.get("regex") or search_options.get("cross_pages"):
+        return {}
+    from index_segments import open_index
+    index = open_index(index_path)
+    if index is None:
+        return {}
+
+    pages = search_options.get("pages")
+    options = {}
+    for pdf_file in pdf_files:
+        candidates = index_pages(index, pdf_file, keywords, stem=search_options.get("stem", False),
+                                 engine=search_options.get("engine", DEFAULT_ENGINE))
+        if candidates is not None:
+            if pages is not None:
+                candidates = sorted(set(candidates) & set(pages))
+            options[pdf_file] = dict(search_options, pages=candidates)
+    return options
+
+
+def search_library(pdf_files, workers=None, max_tasks_per_child=DEFAULT_MAX_TASKS_PER_CHILD,
+                   index_path=None, cache_dir=None, corpus_path=None, ordered=True, timings=None, **search_options):
+    """
+    Паралелно търсене в много PDF файлове (пул от процеси).
+    Най-големите файлове се пускат първи; всеки процес се сменя след
+    max_tasks_per_child файла, за да не расте паметта на pdfminer.
+    Генератор: връща (pdf_file, results, error) – при ordered=True в реда
+    на pdf_files, иначе по реда на завършване.
+    search_options (keywords, regex, engine, pages, ...) се подават на search_in_pdf.
+    timings: по желание SearchTimings – записите от работните процеси се събират в него.
+    index_path: по желание индекс (файл или папка със сегменти) – страниците-кандидати
+    се смятат веднъж тук и всяка задача носи своите (виж _indexed_options)
+    corpus_path: по желание корпус (corpus_store.py) – всеки процес го отваря веднъж
+    и чете текста от него (вместо CorpusStore в search_options, който се праща с всяка задача)
+    """
+    pdf_files = [Path(p) for p in pdf_files]
+    order = {p: i for i, p in enumerate(pdf_files)}
+    workers = workers or os.cpu_count() or 1
+    indexed = _indexed_options(pdf_files, index_path, search_options)
+    tasks = [(pdf_file, indexed.get(pdf_file, search_options), timings is not None)
+             for pdf_file in _largest_first(pdf_files)]
+
+    # multiprocessing.Pool вместо ProcessPoolExecutor: max_tasks_per_child
+    # на executor-а в Python 3.11 може да зависне при смяна на процесите
+    with multiprocessing.Pool(
+        processes=workers,
+        initializer=_init_worker,
+        initargs=(cache_dir, corpus_path),
+        maxtasksperchild=max_tasks_per_child,
+    ) as pool:
+        done_results = {}
+        next_pos = 0
+        for pdf_file, results, error, records in pool.imap_unordered(_search_file, tasks, chunksize=1):
+            if records:
+                timings.merge(records)
+            if not ordered:
+                yield pdf_file, results, error
+                continue
+
+            done_results[order[pdf_file]] = (pdf_file, results, error)
+            while next_pos in done_results:
+                yield done_results.pop(next_pos)
+                next_pos += 1
+
+
+def files_with_matches(pdf_files, **kwargs):
+    """
+    Генератор: файловете, в които има поне едно срещане; всеки файл се
+    чете само до първото срещане
+    """
+    for pdf_file, results, _ in search_library(pdf_files, first_hit_only=True, **kwargs):
+        if results:
+            yield pdf_file
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from pdf_reader import print_hit
+
+    parser = argparse.ArgumentParser(description="Search keywords/regex in all PDFs of a directory in parallel.")
+    parser.add_argument("directory", help="directory with PDF files")
+    parser.add_argument("keywords", nargs="*", help="keywords to search for")
+    parser.add_argument("--regex", help="regular expression to search for")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-tasks-per-child", type=int, default=DEFAULT_MAX_TASKS_PER_CHILD,
+                        help=f"recycle a worker after this many files (default {DEFAULT_MAX_TASKS_PER_CHILD})")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE, help=f"text extraction engine (default {DEFAULT_ENGINE})")
+    parser.add_argument("--index", help="index file built by pdf_index.py")
+    parser.add_argument("--cache-dir", help="page text cache directory (page_cache.py)")
+    parser.add_argument("--max-pages", type=int, default=None, help="only the first N pages of each file")
+    parser.add_argument("-l", "--files-with-matches", action="store_true", help="only list files that contain a match")
+    args = parser.parse_args()
+
+    pdf_files = sorted(Path(args.directory).glob("*.pdf"))
+    options = dict(
+        keywords=args.keywords or None,
+        regex=args.regex,
+        workers=args.workers,
+        max_tasks_per_child=args.max_tasks_per_child,
+        index_path=args.index,
+        cache_dir=args.cache_dir,
+        engine=args.engine,
+        max_pages=args.max_pages,
+    )
+
+    if args.files_with_matches:
+        for pdf_file in files_with_matches(pdf_files, **options):
+            print(pdf_file)
+    else:
+        for pdf_file, results, error in search_library(pdf_files, **options):
+            print(f"\nAnalyzing: {pdf_file.name}")
+            if error:
+                print(f"⚠️ Грешка: {error}")
+            for hit in results:
+                print_hit(hit)
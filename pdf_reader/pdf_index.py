@@ -0,0 +1,449 @@
+import os
+import re
+import time
+from pathlib import Path
+
+from extract_engines import DEFAULT_ENGINE, ENGINES
+from normalize import normalize_text, stem_bg
+from packed_postings import pack_postings, raw_postings, read_header, read_packed, remap_postings, write_packed
+from pdf_reader import extract_text_by_page
+
+INDEX_VERSION = 4
+DEFAULT_INDEX_NAME = ".pdf_index.bin"
+LOOKUP_CACHE_SIZE = 64  # запомнени обхождания на речника (подниз/начало/край на дума)
+CANDIDATE_CACHE_SIZE = 16  # запомнени карти file_id -> страници (виж candidate_pages)
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Разделя текста на думи (малки букви) в реда, в който се срещат
+    """
+    return TOKEN_RE.findall(text.lower())
+
+
+def query_words(keyword):
+    """
+    Думите на ключова дума/фраза, нормализирани както текста при индексиране
+    """
+    return tokenize(normalize_text(keyword))
+
+
+def file_signature(pdf_path):
+    """
+    Евтин подпис на файла: (размер, mtime) – за проверка дали индексът е актуален
+    """
+    st = os.stat(pdf_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def build_index(pdf_files, index_path=None, cache=None, engine=DEFAULT_ENGINE):
+    """
+    Изгражда обърнат индекс: дума -> [(файл, страница, [позиции]), ...]
+    и (по желание) го записва на диск; cache: PageCache за текста по страници,
+    engine: машина за извличане (виж extract_text_by_page).
+    Текстът се нормализира веднъж тук (normalize_text), думите се пазят във вида от текста.
+    """
+    index = {"version": INDEX_VERSION, "engine": engine, "files": [], "postings": {}}
+    for pdf_file in pdf_files:
+        _add_file(index, pdf_file, cache, engine)
+
+    if index_path:
+        save_index(index, index_path)
+    return index
+
+
+def _add_file(index, pdf_file, cache=None, engine=DEFAULT_ENGINE):
+    """
+    Извлича и добавя един файл в края на индекса. Страниците се четат изцяло,
+    преди да се пипне индексът – при грешка в PDF-а индексът остава непроменен.
+    """
+    pdf_file = Path(pdf_file).resolve()
+    size, mtime = file_signature(pdf_file)
+    if cache is not None:
+        page_texts = cache.text_by_page(pdf_file, engine=engine)
+    else:
+        page_texts = extract_text_by_page(pdf_file, engine=engine)
+
+    page_count = 0
+    lengths = []
+    file_postings = {}
+    for page_number, text in page_texts:
+        page_count = page_number
+        terms = tokenize(normalize_text(text))
+        # дължина на страницата в думи (за BM25); липсващите страници са с 0
+        lengths.extend([0] * (page_number - 1 - len(lengths)))
+        lengths.append(len(terms))
+        positions = {}
+        for pos, term in enumerate(terms):
+            positions.setdefault(term, []).append(pos)
+        for term, pos_list in positions.items():
+            file_postings.setdefault(term, []).append([page_number, pos_list])
+
+    file_id = len(index["files"])
+    postings = index["postings"]
+    for term, entries in file_postings.items():
+        postings.setdefault(term, []).extend([file_id, page, pos_list] for page, pos_list in entries)
+    index["files"].append({
+        "path": str(pdf_file),
+        "size": size,
+        "mtime": mtime,
+        "pages": page_count,
+        "lengths": lengths,
+    })
+    _forget_lookups(index)
+    return file_id
+
+
+def _forget_lookups(index):
+    # помощните таблици (_by_path, _stems, _terms, _candidates) се строят наново при следващото търсене
+    for key in [k for k in index if k.startswith("_")]:
+        del index[key]
+
+
+def _remove_files(index, file_ids):
+    """
+    Маха файловете от индекса; останалите file_id се преномерират (без дупки).
+    Постингите се филтрират дума по дума в компресиран вид (remap_postings), без да се
+    разкодира целият индекс; думите без засегнати файлове се копират байт по байт.
+    """
+    file_ids = set(file_ids)
+    if not file_ids:
+        return
+    remap = {}
+    files = []
+    for old_id, entry in enumerate(index["files"]):
+        if old_id not in file_ids:
+            remap[old_id] = len(files)
+            files.append(entry)
+
+    postings = index["postings"]
+    kept = ((term, remap_postings([(raw_postings(postings, term), remap)])) for term in postings)
+    index["files"] = files
+    index["postings"] = pack_postings((term, data) for term, data in kept if data is not None)
+    _forget_lookups(index)
+
+
+def update_index(index, pdf_files, cache=None, engine=DEFAULT_ENGINE):
+    """
+    Привежда индекса в съответствие с pdf_files: маха изчезналите и променените
+    файлове (по размер/mtime) и индексира новите/променените. Непроменените
+    файлове не се отварят. Връща (добавени, изтрити, [(файл, грешка), ...]);
+    променен файл се брои и като изтрит, и като добавен.
+    Ако индексът е строен с друга машина за извличане (engine), всички файлове се
+    индексират наново – индексът винаги отговаря на една машина.
+    """
+    rebuild = index.get("engine") != engine
+    index["engine"] = engine
+    wanted = {}
+    for pdf_file in pdf_files:
+        pdf_file = Path(pdf_file).resolve()
+        wanted[str(pdf_file)] = pdf_file
+
+    stale = []
+    current = set()
+    for file_id, entry in enumerate(index["files"]):
+        path = entry["path"]
+        try:
+            fresh = not rebuild and path in wanted and file_signature(path) == (entry["size"], entry["mtime"])
+        except OSError:
+            fresh = False
+        if fresh:
+            current.add(path)
+        else:
+            stale.append(file_id)
+    _remove_files(index, stale)
+
+    added = 0
+    errors = []
+    for path, pdf_file in sorted(wanted.items()):
+        if path in current:
+            continue
+        try:
+            _add_file(index, pdf_file, cache, engine)
+            added += 1
+        except Exception as e:
+            errors.append((path, f"{type(e).__name__}: {e}"))
+    return added, len(stale), errors
+
+
+def save_index(index, index_path):
+    """
+    Записва индекса атомарно (временен файл + replace) в компресиран двоичен
+    вид (packed_postings.py). Всеки запис получава ново поколение ("generation").
+    """
+    index["generation"] = max(time.time_ns(), index.get("generation", 0) + 1)
+    index_path = Path(index_path)
+    tmp_path = index_path.with_name(index_path.name + ".tmp")
+    write_packed(index, tmp_path)
+    os.replace(tmp_path, index_path)
+
+
+def load_index(index_path):
+    """
+    Зарежда индекс от диск; връща None, ако липсва или е от друга версия.
+    Постингите на всяка дума се разкодират едва при търсене на думата.
+    """
+    index_path = Path(index_path)
+    if not index_path.exists():
+        return None
+
+    index = read_packed(index_path)
+    if index is None or index.get("version") != INDEX_VERSION:
+        return None
+    return index
+
+
+def index_generation(index_path):
+    """
+    Поколението на записания индекс (сменя се при всяко записване) или None
+    """
+    try:
+        header = read_header(index_path)
+    except OSError:
+        return None
+    return header.get("generation") if header else None
+
+
+def find_file(index, pdf_path):
+    """
+    Връща file_id на актуален запис за pdf_path или None (липсва/файлът е променен)
+    """
+    pdf_path = Path(pdf_path).resolve()
+    lookup = index.get("_by_path")
+    if lookup is None:
+        lookup = {f["path"]: i for i, f in enumerate(index["files"])}
+        index["_by_path"] = lookup
+
+    file_id = lookup.get(str(pdf_path))
+    if file_id is None:
+        return None
+
+    entry = index["files"][file_id]
+    try:
+        if file_signature(pdf_path) != (entry["size"], entry["mtime"]):
+            return None
+    except OSError:
+        return None
+    return file_id
+
+
+def _stem_map(index):
+    """
+    Картата основа -> думи от речника; строи се веднъж (до следващата промяна на индекса)
+    """
+    stems = index.get("_stems")
+    if stems is None:
+        stems = {}
+        for term in index["postings"]:
+            stems.setdefault(stem_bg(term), []).append(term)
+        index["_stems"] = stems
+    return stems
+
+
+def stem_terms(index, stem):
+    """
+    Думите от речника с дадена основа (stem_bg)
+    """
+    return _stem_map(index).get(stem, [])
+
+
+def _cached(index, table, key, compute, size=LOOKUP_CACHE_SIZE):
+    """
+    compute() веднъж за key в помощната таблица index[table]; при повече от size
+    записа таблицата се изчиства (заявките се сменят, речникът – не)
+    """
+    cache = index.setdefault(table, {})
+    if key not in cache:
+        if len(cache) >= size:
+            cache.clear()
+        cache[key] = compute()
+    return cache[key]
+
+
+def matching_terms(index, word, whole_words=False, stem=False):
+    """
+    Думите от речника, които съдържат word (или са равни на него при whole_words).
+    stem: сравнява се основата на word – при whole_words само думите със същата основа
+    Обхождането на речника за подниз се помни за word (до следващата промяна на индекса).
+    """
+    postings = index["postings"]
+    if stem:
+        word = stem_bg(word)
+        if whole_words:
+            return stem_terms(index, word)
+    if whole_words:
+        return [word] if word in postings else []
+    return _cached(index, "_terms", ("in", word), lambda: [term for term in postings if word in term])
+
+
+def _keyword_pages(index, keyword, whole_words=False, stem=False):
+    """
+    Множество от (file_id, page), в които keyword може да се среща.
+    Многословните ключови думи се търсят като фраза по позициите.
+    """
+    words = query_words(keyword)
+    if not words:
+        return set()
+
+    if len(words) == 1:
+        pages = set()
+        for term in matching_terms(index, words[0], whole_words, stem):
+            for file_id, page, _ in index["postings"][term]:
+                pages.add((file_id, page))
+        return pages
+
+    # Фраза: първата дума може да е окончание, последната – начало на по-дълга дума
+    # (както при търсене на подниз), средните трябва да съвпадат точно.
+    postings = index["postings"]
+    per_word = []
+    for i, word in enumerate(words):
+        if stem:
+            word = stem_bg(word)
+        if whole_words or 0 < i < len(words) - 1:
+            # word вече е основа – не се подава пак на stem_bg (през matching_terms)
+            terms = stem_terms(index, word) if stem else matching_terms(index, word, whole_words=True)
+        elif i == 0:
+            if stem:
+                terms = _cached(index, "_terms", ("stem-end", word), lambda: [
+                    t for base, group in _stem_map(index).items() if base.endswith(word) for t in group])
+            else:
+                terms = _cached(index, "_terms", ("end", word), lambda: [t for t in postings if t.endswith(word)])
+        else:
+            terms = _cached(index, "_terms", ("start", word), lambda: [t for t in postings if t.startswith(word)])
+
+        positions = {}
+        for term in terms:
+            for file_id, page, pos_list in postings[term]:
+                positions.setdefault((file_id, page), set()).update(pos_list)
+        per_word.append(positions)
+
+    pages = set(per_word[0])
+    for positions in per_word[1:]:
+        pages &= positions.keys()
+
+    result = set()
+    for key in pages:
+        for start in per_word[0][key]:
+            if all(start + offset in per_word[offset][key] for offset in range(1, len(words))):
+                result.add(key)
+                break
+    return result
+
+
+def search_index(index, keywords, whole_words=False, stem=False):
+    """
+    Търси ключови думи/фрази в индекса, без да отваря PDF файловете.
+    stem: "бездната" намира и "бездна", "бездни" (виж normalize.stem_bg).
+    Връща [{"file", "page", "keyword"}, ...] подредени по файл и страница.
+    """
+    if not isinstance(index, dict):
+        index = load_index(index)
+        if index is None:
+            return []
+
+    results = []
+    for kw in keywords:
+        for file_id, page in _keyword_pages(index, kw, whole_words, stem):
+            results.append({
+                "file": index["files"][file_id]["path"],
+                "page": page,
+                "keyword": kw,
+                "_order": (file_id, page),
+            })
+
+    results.sort(key=lambda r: r["_order"])
+    for r in results:
+        del r["_order"]
+    return results
+
+
+def _candidate_map(index, keywords, stem=False):
+    """
+    file_id -> страници с някоя от ключовите думи, за цялата заявка наведнъж;
+    None, ако някоя ключова дума няма думи за индекса (тогава се сканира всичко)
+    """
+    if not all(query_words(kw) for kw in keywords):
+        return None
+    by_file = {}
+    for kw in keywords:
+        for file_id, page in _keyword_pages(index, kw, stem=stem):
+            by_file.setdefault(file_id, set()).add(page)
+    return {file_id: sorted(pages) for file_id, pages in by_file.items()}
+
+
+def candidate_pages(index, pdf_path, keywords, stem=False, engine=None):
+    """
+    Страниците от pdf_path, на които някоя от ключовите думи може да се среща.
+    None означава, че файлът не е в индекса (или е променен) и трябва пълно сканиране.
+    engine: машината, с която ще се търси; ако индексът е строен с друга (или не е
+    записана), думите може да са разделени различно – тогава също None.
+    Картата за всички файлове се смята веднъж за заявката и се помни в индекса,
+    така че търсенето в цяла папка обхожда постингите само веднъж.
+    """
+    if engine is not None and index.get("engine") != engine:
+        return None
+    file_id = find_file(index, pdf_path)
+    if file_id is None:
+        return None
+
+    keywords = tuple(keywords)
+    by_file = _cached(index, "_candidates", (keywords, stem), lambda: _candidate_map(index, keywords, stem),
+                      size=CANDIDATE_CACHE_SIZE)
+    if by_file is None:
+        return None
+    return by_file.get(file_id, [])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or query an inverted index over a PDF directory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="index all *.pdf files in a directory")
+    p_build.add_argument("directory", help="directory with PDF files")
+    p_build.add_argument("--index", help=f"index file (default: <directory>/{DEFAULT_INDEX_NAME})")
+    p_build.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE, help=f"text extraction engine (default {DEFAULT_ENGINE})")
+
+    p_search = sub.add_parser("search", help="query an existing index")
+    p_search.add_argument("index", help="index file")
+    p_search.add_argument("keywords", nargs="+", help="keywords or quoted phrases")
+    p_search.add_argument("--whole-words", action="store_true", help="match whole words only")
+    p_search.add_argument("--stem", action="store_true", help="match Bulgarian word forms by stem")
+
+    p_query = sub.add_parser("query", help="boolean/phrase/proximity query (see query_lang.py)")
+    p_query.add_argument("index", help="index file")
+    p_query.add_argument("query", help='e.g. \'бездна NEAR/5 пустота NOT "черна дупка"\'')
+    p_query.add_argument("--stem", action="store_true", help="match Bulgarian word forms by stem")
+
+    p_rank = sub.add_parser("rank", help="BM25-ranked pages (top-k)")
+    p_rank.add_argument("index", help="index file")
+    p_rank.add_argument("keywords", nargs="+", help="keywords")
+    p_rank.add_argument("-k", "--top", type=int, default=20, help="results per page of output (default 20)")
+    p_rank.add_argument("--offset", type=int, default=0, help="skip the first N ranked results")
+    p_rank.add_argument("--stem", action="store_true", help="match Bulgarian word forms by stem")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        directory = Path(args.directory)
+        index_path = Path(args.index) if args.index else directory / DEFAULT_INDEX_NAME
+        index = build_index(sorted(directory.glob("*.pdf")), index_path, engine=args.engine)
+        print(f"Индексирани файлове: {len(index['files'])}, думи: {len(index['postings'])} -> {index_path}")
+    elif args.command == "rank":
+        from ranking import bm25_search
+
+        response = bm25_search(args.index, args.keywords, k=args.top, offset=args.offset, stem=args.stem)
+        print(f"Страници със съвпадение: {response['total']}")
+        for r in response["results"]:
+            print(f"{r['score']:8.3f}\t{Path(r['file']).name}\tстр. {r['page']}")
+    elif args.command == "query":
+        from query_lang import search_query
+
+        for r in search_query(args.index, args.query, stem=args.stem):
+            print(f"{Path(r['file']).name}\tстр. {r['page']}\t{len(r['spans'])}")
+    else:
+        for r in search_index(args.index, args.keywords, whole_words=args.whole_words, stem=args.stem):
+            print(f"{Path(r['file']).name}\tстр. {r['page']}\t{r['keyword']}")
@@ -1,74 +1,491 @@
-from pdfminer.high_level import extract_pages
-from pdfminer.layout import LTTextContainer
 from pathlib import Path
+import json
 import re
+import sys
+import time
 
-def extract_text_by_page(pdf_path):
+from extract_engines import BOX_LEVELS, DEFAULT_ENGINE, ENGINES, get_engine, pdfminer_layout_boxes
+from keyword_matcher import KeywordMatcher
+
+CROSS_PAGE_WINDOW = 200  # символа от края на страницата, пренесени към следващата (поне)
+SEAM_HYPHEN_RE = re.compile(r"(?<=\w)[-\u2010\u2011]\s*$")  # пренесена дума в края на страницата
+
+def extract_text_by_page(pdf_path, pages=None, engine=DEFAULT_ENGINE, timings=None):
     """
     Генератор: връща (page_number, text) за всяка страница
+    pages: по желание – номера на страници (от 1), само те се обработват
+    engine: машина за извличане – "pdfminer-layout", "pdfminer-raw" или "pypdf"
+    timings: по желание SearchTimings (search_timing.py) – времена по страница и етап
+    """
+    # Машините зареждат pdfminer/pypdf едва при извикване, за да не се плаща вноса при четене от кеша
+    extract = get_engine(engine)
+    yield from extract(pdf_path, sorted(set(pages)) if pages is not None else None, timings=timings)
+
+def page_count(pdf_path):
     """
-    for page_number, page_layout in enumerate(extract_pages(pdf_path), start=1):
-        page_text = []
-        for element in page_layout:
-            if isinstance(element, LTTextContainer):
-                page_text.append(element.get_text())
-        yield page_number, "".join(page_text)
+    Брой страници според каталога на PDF-а (без разбор на съдържанието)
+    """
+    from pdfminer.pdfdocument import PDFDocument
+    from pdfminer.pdfparser import PDFParser
+    from pdfminer.pdftypes import resolve1
+
+    with open(pdf_path, "rb") as f:
+        document = PDFDocument(PDFParser(f))
+        return int(resolve1(resolve1(document.catalog["Pages"])["Count"]))
 
-def search_in_pdf(pdf_path, keywords=None, regex=None):
+def search_in_pdf(pdf_path, keywords=None, regex=None, **options):
     """
-    Търси ключови думи или regex в PDF файл
+    Търси ключови думи или regex в PDF файл; връща списък (виж iter_search за options)
+    """
+    return list(iter_search(pdf_path, keywords=keywords, regex=regex, **options))
+
+def index_pages(index, pdf_path, keywords, stem=False, engine=DEFAULT_ENGINE):
     """
-    results = []
+    Страниците от pdf_path, на които ключовите думи могат да се срещат според индекса
+    (pdf_index или SegmentedIndex); None – файлът трябва да се прочете целия
+    """
+    if isinstance(index, dict):
+        from pdf_index import candidate_pages
+        return candidate_pages(index, pdf_path, keywords, stem=stem, engine=engine)
+    return index.candidate_pages(pdf_path, keywords, stem=stem, engine=engine)  # SegmentedIndex
+
+
+def iter_search(pdf_path, keywords=None, regex=None, index=None, cache=None, engine=DEFAULT_ENGINE,
+                pages=None, max_pages=None, first_hit_only=False, timings=None, extractor=None,
+                normalize=False, stem=False, cross_pages=False, boxes=None):
+    """
+    Генератор: връща резултатите един по един, докато страниците се обработват
+    Ключовите думи се търсят с един проход на страница (KeywordMatcher).
+    Всяко срещане е отделен резултат със "span" = (start, end) в текста на страницата.
+    index: по желание – индекс от pdf_index (или SegmentedIndex от index_segments); ако файлът
+    е в него и е актуален, се четат само страниците, на които ключовите думи могат да се срещат
+    cache: по желание – PageCache от page_cache; текстът се взема от кеша, а Bloom
+    филтрите му пропускат файловете/страниците, в които ключовите думи не могат да са
+    engine: машина за извличане (виж extract_text_by_page)
+    pages / max_pages: търси само в тези страници (от 1) / в първите max_pages страници
+    first_hit_only: спира разбора на файла при първото срещане (за "кои файлове съдържат X")
+    timings: по желание SearchTimings – времена за извличане и търсене по страница
+    extractor: по желание заместител на extract_text_by_page със същия интерфейс
+    (напр. IsolatedExtractor от isolated_extract – извличане в отделен процес с бюджет)
+    normalize: търси в нормализирания текст (normalize.normalize_text – NFC, без меки
+    тирета/лигатури, слети пренесени думи); span и context са спрямо него
+    stem: еднословните ключови думи се търсят по основата си ("бездната" намира "бездни")
+    cross_pages: намира и фрази, разделени от нов ред или от границата между две
+    последователни страници; от предишната страница се пази само края ѝ (виж seam_hits).
+    Такъв резултат има "page" (началото), "end_page" (краят) и "span" = (start в
+    първата, end във втората страница). Индексът и Bloom филтрите не стесняват страниците.
+    boxes: "blocks" или "lines" – всеки резултат получава "boxes" = [[x0, y0, x1, y1], ...]
+    (правоъгълниците на текстовите блокове/редове със срещането, в точки от долния ляв ъгъл
+    на страницата; резултат през две страници има и "end_boxes" за втората). Текстът и
+    правоъгълниците идват от един и същ разбор с pdfminer-layout – без cache и extractor.
+    """
+    if boxes is not None:
+        if boxes not in BOX_LEVELS:
+            raise ValueError(f"Непознато ниво на правоъгълниците: {boxes} (налични: {', '.join(BOX_LEVELS)})")
+        if normalize:
+            raise ValueError("boxes не може с normalize – позициите в нормализирания текст са други")
+
+    if pages is not None and any(p < 1 for p in pages):
+        raise ValueError("Страниците се броят от 1")
+    if max_pages is not None:
+        pages = range(1, max_pages + 1) if pages is None else [p for p in pages if p <= max_pages]
+
+    if index is not None and keywords and not regex and not cross_pages:
+        candidates = index_pages(index, pdf_path, keywords, stem=stem, engine=engine)
+        if candidates is not None:
+            pages = candidates if pages is None else sorted(set(candidates) & set(pages))
 
-    for page_number, text in extract_text_by_page(pdf_path):
-        if keywords:
-            for kw in keywords:
-                if kw.lower() in text.lower():
-                    results.append({
-                        "page": page_number,
-                        "keyword": kw,
-                        "context": get_context(text, kw)
-                    })
+    patterns = None
+    if keywords:
+        if stem:
+            patterns = stem_patterns(keywords)  # вече нормализирани
+        elif normalize:
+            from normalize import normalize_text
+            # текстът се нормализира – думите също, иначе "ﬁle" или NFD форма не се намират
+            patterns = [normalize_text(kw) for kw in keywords]
+        else:
+            patterns = list(keywords)
 
-        if regex:
-            for match in re.finditer(regex, text, re.IGNORECASE):
-                results.append({
-                    "page": page_number,
-                    "pattern": match.group(),
-                    "context": get_context(text, match.group())
-                })
+    if cache is not None and patterns and not regex and not cross_pages:
+        # Bloom филтрите от кеша: документите/страниците, където думите със сигурност липсват, се пропускат
+        bloom = cache.bloom(pdf_path, engine)
+        if bloom is not None:
+            candidates = bloom.candidate_pages(patterns, pages)
+            if candidates is not None:
+                pages = candidates
+
+    if pages is not None:
+        pages = sorted(set(pages))
+        if not pages:
+            return
+
+    if boxes is not None:
+        page_texts = pdfminer_layout_boxes(pdf_path, pages, timings=timings, level=boxes)
+    else:
+        if cache is not None:
+            page_texts = cache.text_by_page(pdf_path, pages=pages, engine=engine, timings=timings, extractor=extractor)
+        else:
+            extract = extractor or extract_text_by_page
+            page_texts = extract(pdf_path, pages=pages, engine=engine, timings=timings)
+        page_texts = ((page_number, text, None) for page_number, text in page_texts)
+
+    matcher = KeywordMatcher(keywords, patterns) if keywords else None
+    pattern = re.compile(regex, re.IGNORECASE) if regex else None
+    if normalize:
+        from normalize import normalize_text
+    if cross_pages:
+        window = max([CROSS_PAGE_WINDOW] + [len(p) for p in patterns or []])
+    previous = previous_boxes = None  # (номер, текст) и PageBoxes на предишната страница
+    previous_starts = set()  # началата на срещанията в самата предишна страница
+
+    for page_number, text, page_boxes in page_texts:
+        t0 = time.perf_counter()
+        if normalize:
+            text = normalize_text(text)
+        if cross_pages:
+            # новият ред е интервал за търсенето (същата дължина – span и context не се менят)
+            text = text.replace("\n", " ")
+            hits = []
+            if previous is not None and previous[0] + 1 == page_number:
+                hits = seam_hits(*previous, page_number, text, matcher, pattern, window, dehyphenate=normalize,
+                                 reported=previous_starts)
+            page_only = page_hits(page_number, text, matcher, pattern)
+            previous_starts = {(hit.get("keyword"), hit["span"][0]) for hit in page_only}
+            hits += page_only
+        else:
+            hits = page_hits(page_number, text, matcher, pattern)
+        if page_boxes is not None:
+            for hit in hits:
+                start, end = hit["span"]
+                if "end_page" in hit:
+                    hit["boxes"] = previous_boxes.find(start, len(previous[1]))
+                    hit["end_boxes"] = page_boxes.find(0, end)
+                else:
+                    hit["boxes"] = page_boxes.find(start, end)
+        if cross_pages:
+            previous, previous_boxes = (page_number, text), page_boxes
+        if timings is not None:
+            timings.add(pdf_path, page_number, "match", time.perf_counter() - t0)
+
+        for hit in hits:
+            yield hit
+            if first_hit_only:
+                return
+
+def seam_hits(page_number, text, next_page, next_text, matcher=None, pattern=None,
+              window=CROSS_PAGE_WINDOW, dehyphenate=False, reported=()):
+    """
+    Срещанията, които започват в края на една страница и свършват в началото на
+    следващата. Търси се само в "шева": последните window символа от text + интервал +
+    първите window символа от next_text. Срещанията изцяло в едната страница се
+    пропускат – тях ги намира page_hits.
+    dehyphenate: "бездна- | та" се слива в "бездната" (както normalize_text в една страница)
+    reported: (ключова дума или None за regex, начало в text) на вече отчетените срещания
+    в самата страница – те не се отчитат втори път (напр. regex "void.*", продължен в следващата)
+    """
+    tail_start = max(0, len(text) - window)
+    tail = text[tail_start:].rstrip()
+    head = next_text[:window]
+    head_start = len(head) - len(head.lstrip())
+    head = head[head_start:]
+    if not tail or not head:
+        return []
+
+    sep = " "
+    if dehyphenate and head[0].isalnum():
+        hyphen = SEAM_HYPHEN_RE.search(tail)
+        if hyphen:
+            tail, sep = tail[:hyphen.start()], ""
+    seam = tail + sep + head
+    head_offset = len(tail) + len(sep)
+
+    found = []
+    if matcher:
+        found += [(start, end, "keyword", kw) for start, end, kw in sorted(matcher.finditer(seam))]
+    if pattern:
+        found += [(*match.span(), "pattern", match.group()) for match in pattern.finditer(seam)]
+
+    hits = []
+    for start, end, kind, value in found:
+        if start >= len(tail) or end <= head_offset or (value if kind == "keyword" else None, tail_start + start) in reported:
+            continue
+        hits.append({
+            "page": page_number,
+            "end_page": next_page,
+            kind: value,
+            "span": (tail_start + start, head_start + end - head_offset),
+            "context": get_context(seam, start, end)
+        })
+    return hits
+
+def stem_patterns(keywords):
+    """
+    Основите на еднословните ключови думи (за KeywordMatcher); фразите остават както са
+    """
+    from normalize import normalize_text, stem_bg
+    from pdf_index import query_words
 
-    return results
+    patterns = []
+    for kw in keywords:
+        words = query_words(kw)
+        patterns.append(stem_bg(words[0]) if len(words) == 1 else normalize_text(kw))
+    return patterns
 
-def get_context(text, match, window=80):
+def page_hits(page_number, text, matcher=None, pattern=None):
     """
-    Връща текстов контекст около намереното
+    Всички срещания в текста на една страница: първо ключовите думи (по позиция), после regex
     """
-    index = text.lower().find(match.lower())
-    if index == -1:
-        return ""
+    hits = []
+    if matcher:
+        for start, end, kw in sorted(matcher.finditer(text)):
+            hits.append({
+                "page": page_number,
+                "keyword": kw,
+                "span": (start, end),
+                "context": get_context(text, start, end)
+            })
 
-    start = max(0, index - window)
-    end = min(len(text), index + len(match) + window)
+    if pattern:
+        for match in pattern.finditer(text):
+            hits.append({
+                "page": page_number,
+                "pattern": match.group(),
+                "span": match.span(),
+                "context": get_context(text, *match.span())
+            })
+    return hits
+
+def get_context(text, start, end, window=80):
+    """
+    Връща текстов контекст около намереното – text[start:end] плюс window символа от двете страни
+    """
+    start = max(0, start - window)
+    end = min(len(text), end + window)
     return text[start:end].replace("\n", " ").strip()
 
+def hit_to_jsonl(pdf_file, hit):
+    """
+    Един резултат като JSON ред (с пътя на файла)
+    """
+    return json.dumps({"file": str(pdf_file), **hit}, ensure_ascii=False) + "\n"
+
+def print_hit(hit):
+    if "end_page" in hit:
+        print(f"\n📄 Страници {hit['page']}–{hit['end_page']}")
+    else:
+        print(f"\n📄 Страница {hit['page']}")
+    print(f"🔎 Намерено: {hit.get('keyword') or hit.get('pattern')}")
+    print(f"🧠 Контекст: {hit['context']}")
+
+def parse_pages(spec):
+    """
+    "1-30,45" -> [1, 2, ..., 30, 45]; страниците се броят от 1
+    """
+    pages = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            pages.update(range(int(first), int(last) + 1))
+        else:
+            pages.add(int(part))
+    if pages and min(pages) < 1:
+        raise ValueError(f"Страниците се броят от 1: {spec}")
+    return sorted(pages)
+
+def main(argv=None):
+    import argparse
+
+    from pdf_index import DEFAULT_INDEX_NAME
+    from index_segments import DEFAULT_SEGMENTS_NAME, open_index
+    from page_cache import DEFAULT_CACHE_DIR, PageCache
+    from parallel_search import search_library
+    from search_timing import SearchTimings, format_summary
+    from isolated_extract import DEFAULT_MAX_MEMORY, DEFAULT_TIMEOUT, IsolatedExtractor
+    from result_cache import ResultCache, library_generation
+    from corpus_store import DEFAULT_CORPUS_NAME, CorpusStore
+
+    parser = argparse.ArgumentParser(description="Search keywords/regex in all PDFs of a directory.")
+    parser.add_argument("directory", nargs="?", default="D:/изтегляния download/Книги 2025 г", help="directory with PDF files")
+    parser.add_argument("--keywords", nargs="+", default=["бездна", "пустота", "Абсолют"], help="keywords to search for")
+    parser.add_argument("--regex", default=None, help="regular expression to search for")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default=DEFAULT_ENGINE, help=f"text extraction engine (default {DEFAULT_ENGINE})")
+    parser.add_argument("--pages", type=parse_pages, default=None, help="only these pages, e.g. '1-30,45'")
+    parser.add_argument("--max-pages", type=int, default=None, help="only the first N pages of each file")
+    parser.add_argument("--first-hit-only", action="store_true", help="stop reading a file at its first hit")
+    parser.add_argument("-l", "--files-with-matches", action="store_true", help="only list files that contain a match")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count; 1 = stream page by page)")
+    parser.add_argument("--jsonl", metavar="FILE", help="write hits as JSON lines to FILE ('-' for stdout) as they are found")
+    parser.add_argument("--isolate", action="store_true", help="extract each file in a child process with a time/memory budget")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help=f"per-file time budget in seconds with --isolate (default {DEFAULT_TIMEOUT})")
+    parser.add_argument("--max-memory", type=int, default=DEFAULT_MAX_MEMORY // 1024 ** 2, help="per-file address space limit in MB with --isolate (POSIX only)")
+    parser.add_argument("--report", metavar="FILE", help="write files that failed or went over budget to FILE as JSON")
+    parser.add_argument("--timings", metavar="FILE", help="record per-page stage timings, print a summary and save them as JSON to FILE")
+    parser.add_argument("--normalize", action="store_true", help="search normalized text (NFC, no soft hyphens/ligatures, joined hyphenated words)")
+    parser.add_argument("--stem", action="store_true", help="match Bulgarian word forms by stem")
+    parser.add_argument("--boxes", choices=BOX_LEVELS, default=None, help="add page coordinates of the matching text blocks or lines to each hit (pdfminer-layout)")
+    parser.add_argument("--cross-pages", action="store_true", help="also match phrases split across lines or across a page break")
+    parser.add_argument("--corpus", action="store_true", help="read page text from the corpus built with corpus_store.py instead of the PDFs")
+    parser.add_argument("--no-result-cache", action="store_true", help="do not read or write the persistent query result cache")
+    parser.add_argument("--fts", action="store_true", help="ranked query against the SQLite FTS5 database instead of scanning PDFs")
+    parser.add_argument("--limit", type=int, default=50, help="max results with --fts (default 50)")
+    args = parser.parse_args(argv)
+
+    pdf_directory = Path(args.directory)
+
+    if args.fts:
+        # Built with: python fts_store.py sync "<pdf_directory>"
+        from fts_store import DEFAULT_DB_NAME, FtsStore, quote_terms
+
+        with FtsStore(pdf_directory / DEFAULT_DB_NAME) as store:
+            for r in store.search(quote_terms(args.keywords), limit=args.limit):
+                print(f"\n📄 {Path(r['file']).name}, страница {r['page']}")
+                print(f"🧠 Контекст: {r['snippet']}")
+        return
+
+    pdf_files = sorted(pdf_directory.glob("*.pdf"))
+
+    # Built with: python pdf_index.py build "<pdf_directory>"
+    # or (segments) python index_segments.py update "<pdf_directory>"
+    index_path = pdf_directory / DEFAULT_SEGMENTS_NAME
+    if not index_path.exists():
+        index_path = pdf_directory / DEFAULT_INDEX_NAME
+    if not index_path.exists():
+        index_path = None
+
+    options = {
+        "keywords": args.keywords,
+        "regex": args.regex,
+        "engine": args.engine,
+        "pages": args.pages,
+        "max_pages": args.max_pages,
+        "first_hit_only": args.first_hit_only or args.files_with_matches,
+        "normalize": args.normalize,
+        "stem": args.stem,
+        "cross_pages": args.cross_pages,
+        "boxes": args.boxes,
+    }
+    if args.isolate:
+        options["extractor"] = IsolatedExtractor(timeout=args.timeout, max_memory=args.max_memory * 1024 ** 2)
+    # Built with: python corpus_store.py build "<pdf_directory>"
+    # (отваря се веднъж – тук или във всеки работен процес, не за всеки файл)
+    corpus_path = pdf_directory / DEFAULT_CORPUS_NAME if args.corpus and not args.isolate else None
+    skipped = []
+    timings = SearchTimings() if args.timings else None
+    # с --timings текстът не се взема от кеша на страниците – иначе топлото пускане
+    # не мери нито разбор, нито символи
+    page_cache_dir = None if args.timings else DEFAULT_CACHE_DIR
+
+    out = None
+    if args.jsonl == "-":
+        out = sys.stdout
+    elif args.jsonl:
+        out = open(args.jsonl, "w", encoding="utf-8")
+
+    # Кеш на резултатите: същата заявка при същото поколение на индекса и файловете
+    # се отговаря от диска; с --isolate/--timings винаги се търси наново
+    cached = cache_writer = None
+    if not (args.no_result_cache or args.isolate or args.timings):
+        result_cache = ResultCache()
+        query = {"directory": str(pdf_directory.resolve()), "corpus": args.corpus,
+                 **{k: v for k, v in options.items() if k != "extractor"}}
+        generation = library_generation(pdf_files, index_path, corpus_path)
+        cached = result_cache.get(query, generation)
+        if cached is None:
+            # записите ({"file"}, {"hit"}, {"error"}) отиват на диска, докато се намират
+            cache_writer = result_cache.writer(query, generation)
+
+    def record(entry):
+        if cache_writer is not None:
+            cache_writer.add(entry)
+
+    def emit(pdf_file, hit):
+        record({"hit": hit})
+        if args.files_with_matches:
+            if out is not None:
+                out.write(json.dumps({"file": str(pdf_file)}, ensure_ascii=False) + "\n")
+                out.flush()
+            else:
+                print(pdf_file)
+        elif out is not None:
+            out.write(hit_to_jsonl(pdf_file, hit))
+            out.flush()
+        else:
+            print_hit(hit)
+
+    def announce(pdf_file):
+        record({"file": str(pdf_file)})
+        if out is None and not args.files_with_matches:
+            print(f"\nAnalyzing: {pdf_file.name}")
+
+    def finish_file(pdf_file, error):
+        if error:
+            record({"error": error})
+            skipped.append({"file": str(pdf_file), "error": error})
+            print(f"⚠️ Грешка ({pdf_file.name}): {error}", file=sys.stderr)
+
+    complete = False
+    try:
+        if cached is not None:
+            pdf_file = None
+            for entry in cached:
+                if "file" in entry:
+                    pdf_file = Path(entry["file"])
+                    announce(pdf_file)
+                elif "hit" in entry:
+                    emit(pdf_file, entry["hit"])
+                elif "error" in entry:
+                    skipped.append({"file": str(pdf_file), "error": entry["error"]})
+        elif args.workers == 1:
+            pdf_index = open_index(index_path) if index_path else None
+            page_cache = PageCache(page_cache_dir) if page_cache_dir else None
+            if corpus_path is not None:
+                options["extractor"] = CorpusStore(corpus_path)
+            for pdf_file in pdf_files:
+                announce(pdf_file)
+                error = None
+                try:
+                    for hit in iter_search(pdf_file, index=pdf_index, cache=page_cache, timings=timings, **options):
+                        emit(pdf_file, hit)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                finish_file(pdf_file, error)
+        else:
+            for pdf_file, results, error in search_library(
+                pdf_files,
+                workers=args.workers,
+                index_path=index_path,
+                cache_dir=page_cache_dir,
+                corpus_path=corpus_path,
+                timings=timings,
+                # JSON редовете носят пътя на файла – пишат се по реда на завършване,
+                # без да се чакат (и трупат в паметта) по-бавните файлове преди тях
+                ordered=out is None,
+                **options
+            ):
+                announce(pdf_file)
+                for hit in results:
+                    emit(pdf_file, hit)
+                finish_file(pdf_file, error)
+        complete = True
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+        if cache_writer is not None:
+            if complete:
+                cache_writer.commit()
+            else:
+                cache_writer.discard()
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(skipped, f, ensure_ascii=False, indent=2)
+
+    if timings is not None:
+        timings.to_json(args.timings)
+        print(format_summary(timings.summary()), file=sys.stderr)
+
 if __name__ == "__main__":
-    pdf_directory = Path("D:/изтегляния download/Книги 2025 г")
-    pdf_files = list(pdf_directory.glob("*.pdf"))
-
-    # Update keywords for the search
-    keywords = ["бездна", "пустота", "Абсолют"]
-    regex_pattern = None  # Add regex if needed
-
-    for pdf_file in pdf_files:
-        print(f"\nAnalyzing: {pdf_file.name}")
-        results = search_in_pdf(
-            pdf_file,
-            keywords=keywords,
-            regex=regex_pattern
-        )
-
-        for r in results:
-            print(f"\n📄 Страница {r['page']}")
-            print(f"🔎 Намерено: {r.get('keyword') or r.get('pattern')}")
-            print(f"🧠 Контекст: {r['context']}")
\ No newline at end of file
+    main()
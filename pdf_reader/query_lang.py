@@ -0,0 +1,253 @@
+import re
+from bisect import bisect_left
+
+from normalize import stem_bg
+from pdf_index import load_index, query_words, stem_terms
+
+# Езикът на заявките:
+#   бездна пустота            – и двете думи на страницата (AND по подразбиране)
+#   бездна OR пустота         – коя да е от двете
+#   бездна NOT пустота        – първата без втората
+#   "черна дупка"             – фраза (поредни думи)
+#   бездна NEAR/5 пустота     – до 5 думи една от друга (NEAR = NEAR/10)
+#   безд*                     – думи, започващи с "безд"
+#   ( ... )                   – групиране
+# Операторите се пишат с главни букви; думите се сравняват с малки букви.
+# С stem=True думите (без префиксите) съвпадат с всички форми със същата основа.
+
+DEFAULT_NEAR = 10
+
+LEX_RE = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"|(NEAR(?:/(\d+))?)(?=[\s("]|$)|([^\s()"]+))')
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+def lex(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        m = LEX_RE.match(text, pos)
+        if not m or m.end() == pos:
+            raise QuerySyntaxError(f"Неочакван символ на позиция {pos}: {text[pos:pos + 10]!r}")
+        pos = m.end()
+        lparen, rparen, phrase, near, near_n, word = m.groups()
+        if lparen:
+            tokens.append(("(", None))
+        elif rparen:
+            tokens.append((")", None))
+        elif phrase is not None:
+            tokens.append(("PHRASE", phrase))
+        elif near:
+            tokens.append(("NEAR", int(near_n) if near_n else DEFAULT_NEAR))
+        elif word in ("AND", "OR", "NOT"):
+            tokens.append((word, None))
+        elif word.startswith("NEAR/"):
+            raise QuerySyntaxError(f"Разстоянието в NEAR трябва да е число: {word!r}")
+        else:
+            tokens.append(("WORD", word))
+    return tokens
+
+
+def parse_query(text):
+    """
+    Разбира заявката до дърво от кортежи:
+    ("term", дума) ("prefix", начало) ("phrase", [думи]) ("and", a, b) ("or", a, b)
+    ("not", a) ("near", a, b, n)
+    """
+    tokens = lex(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos][0] if pos < len(tokens) else None
+
+    def take():
+        nonlocal pos
+        pos += 1
+        return tokens[pos - 1]
+
+    def parse_or():
+        node = parse_and()
+        while peek() == "OR":
+            take()
+            node = ("or", node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_not()
+        while peek() in ("AND", "NOT", "WORD", "PHRASE", "("):
+            if peek() == "AND":
+                take()
+            node = ("and", node, parse_not())
+        return node
+
+    def parse_not():
+        if peek() == "NOT":
+            take()
+            return ("not", parse_not())
+        return parse_near()
+
+    def parse_near():
+        node = parse_primary()
+        while peek() == "NEAR":
+            _, n = take()
+            node = ("near", node, parse_primary(), n)
+        return node
+
+    def parse_primary():
+        kind = peek()
+        if kind == "(":
+            take()
+            node = parse_or()
+            if peek() != ")":
+                raise QuerySyntaxError("Липсва затваряща скоба")
+            take()
+            return node
+        if kind == "PHRASE":
+            words = query_words(take()[1])
+            if not words:
+                raise QuerySyntaxError("Празна фраза")
+            return ("phrase", words) if len(words) > 1 else ("term", words[0])
+        if kind == "WORD":
+            word = take()[1]
+            if word.endswith("*") and len(word) > 1:
+                prefix = query_words(word[:-1])
+                if len(prefix) == 1:
+                    return ("prefix", prefix[0])
+            words = query_words(word)
+            if not words:
+                raise QuerySyntaxError(f"Няма думи в {word!r}")
+            return ("phrase", words) if len(words) > 1 else ("term", words[0])
+        raise QuerySyntaxError(f"Очаква се дума, фраза или '(' – получено {kind or 'край на заявката'}")
+
+    if not tokens:
+        raise QuerySyntaxError("Празна заявка")
+    node = parse_or()
+    if pos != len(tokens):
+        raise QuerySyntaxError(f"Излишен елемент: {tokens[pos][0]}")
+    return node
+
+
+# Резултатът от всеки възел е {(file_id, page): [(start, end), ...]} – сортирани
+# интервали от позиции на думи (end е изключен); за NOT интервалите са празни.
+
+def _term_spans(index, terms):
+    result = {}
+    postings = index["postings"]
+    for term in terms:
+        for file_id, page, pos_list in postings.get(term, ()):
+            result.setdefault((file_id, page), []).extend((p, p + 1) for p in pos_list)
+    if len(terms) > 1:
+        for spans in result.values():
+            spans.sort()
+    return result
+
+
+def _phrase_spans(index, word_terms):
+    per_word = [_term_spans(index, terms) for terms in word_terms]
+    keys = set(min(per_word, key=len))
+    for spans in per_word:
+        keys &= spans.keys()
+
+    result = {}
+    for key in keys:
+        later = [{start for start, _ in spans[key]} for spans in per_word[1:]]
+        starts = [start for start, _ in per_word[0][key]
+                  if all(start + i + 1 in positions for i, positions in enumerate(later))]
+        if starts:
+            result[key] = [(s, s + len(word_terms)) for s in starts]
+    return result
+
+
+def _near(a, b, n):
+    """
+    Двойки интервали от a и b с най-много n думи между тях – чрез сливане на сортирани списъци.
+    Застъпващи се интервали (напр. една и съща дума от двете страни) не са двойка.
+    """
+    result = {}
+    small, large = (a, b) if len(a) <= len(b) else (b, a)
+    for key, spans_small in small.items():
+        spans_large = large.get(key)
+        if not spans_large:
+            continue
+        starts = [s for s, _ in spans_large]
+        longest = max(e - s for s, e in spans_large)
+        found = []
+        for s1, e1 in spans_small:
+            # кандидати: интервалите от large, започващи в [s1 - n - longest, e1 + n]
+            i = bisect_left(starts, s1 - n - longest)
+            while i < len(spans_large) and spans_large[i][0] <= e1 + n:
+                s2, e2 = spans_large[i]
+                gap = max(s2 - e1, s1 - e2, 0)
+                if gap <= n and (s2 >= e1 or s1 >= e2):
+                    found.append((min(s1, s2), max(e1, e2)))
+                i += 1
+        if found:
+            result[key] = sorted(set(found))
+    return result
+
+
+def _all_pages(index):
+    return {(file_id, page): [] for file_id, f in enumerate(index["files"]) for page in range(1, f["pages"] + 1)}
+
+
+def _word_terms(index, word, stem):
+    return stem_terms(index, stem_bg(word)) if stem else [word]
+
+
+def evaluate(index, node, stem=False):
+    """
+    Изчислява дървото на заявката върху позиционния индекс (само сечения/обединения
+    на списъци, без обхождане на текста)
+    """
+    kind = node[0]
+    if kind == "term":
+        return _term_spans(index, _word_terms(index, node[1], stem))
+    if kind == "prefix":
+        return _term_spans(index, [t for t in index["postings"] if t.startswith(node[1])])
+    if kind == "phrase":
+        return _phrase_spans(index, [_word_terms(index, w, stem) for w in node[1]])
+    if kind == "near":
+        return _near(evaluate(index, node[1], stem), evaluate(index, node[2], stem), node[3])
+    if kind == "not":
+        excluded = evaluate(index, node[1], stem)
+        return {key: [] for key in _all_pages(index) if key not in excluded}
+    if kind == "and":
+        left = node[1]
+        # "a NOT b" -> разлика, без да се строи множеството от всички страници
+        if node[2][0] == "not":
+            a = evaluate(index, left, stem)
+            excluded = evaluate(index, node[2][1], stem)
+            return {key: spans for key, spans in a.items() if key not in excluded}
+        a = evaluate(index, left, stem)
+        if not a:
+            return {}
+        b = evaluate(index, node[2], stem)
+        return {key: sorted(set(spans + b[key])) for key, spans in a.items() if key in b}
+    if kind == "or":
+        a = evaluate(index, node[1], stem)
+        b = evaluate(index, node[2], stem)
+        result = dict(a)
+        for key, spans in b.items():
+            result[key] = sorted(set(result.get(key, []) + spans))
+        return result
+    raise QuerySyntaxError(f"Непознат възел: {kind}")
+
+
+def search_query(index, query, stem=False):
+    """
+    Изпълнява заявка върху индекса; връща [{"file", "page", "spans"}] по файл и страница.
+    spans са интервали от позиции на думи в страницата.
+    """
+    if not isinstance(index, dict):
+        index = load_index(index)
+        if index is None:
+            return []
+
+    matches = evaluate(index, parse_query(query), stem)
+    return [
+        {"file": index["files"][file_id]["path"], "page": page, "spans": matches[(file_id, page)]}
+        for file_id, page in sorted(matches)
+    ]
@@ -0,0 +1,129 @@
+import heapq
+import math
+from itertools import groupby
+
+from pdf_index import load_index, matching_terms, query_words
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def _term_stream(index, terms):
+    """
+    Обединява постингите на няколко думи (напр. всички думи, съдържащи ключовата)
+    в един поток ((file_id, page), tf) по реда на файл и страница
+    """
+    postings = index["postings"]
+    streams = [((file_id, page, len(pos_list)) for file_id, page, pos_list in postings[t]) for t in terms]
+    merged = heapq.merge(*streams)
+    for key, group in groupby(merged, key=lambda p: (p[0], p[1])):
+        yield key, sum(tf for _, _, tf in group)
+
+
+def _query_terms(index, keywords, whole_words, stem=False):
+    """
+    [(дума, думи от речника, които ѝ съответстват), ...] за всяка дума от ключовите думи/фрази
+    """
+    groups = []
+    seen = set()
+    for kw in keywords:
+        for word in query_words(kw):
+            if word in seen:
+                continue
+            seen.add(word)
+            terms = matching_terms(index, word, whole_words, stem)
+            if terms:
+                groups.append((word, terms))
+    return groups
+
+
+def _collection_stats(index, skip=()):
+    """
+    (брой страници, сума от дължините) на индекса без файловете в skip
+    """
+    page_total = 0
+    length_total = 0
+    for file_id, f in enumerate(index["files"]):
+        if file_id not in skip:
+            page_total += len(f["lengths"])
+            length_total += sum(f["lengths"])
+    return page_total, length_total
+
+
+def _document_frequencies(index, groups, skip=()):
+    """
+    Брой страници с думата (df) за всяка група – без да се пазят страниците
+    """
+    return [sum(1 for (file_id, _), _ in _term_stream(index, terms) if file_id not in skip) for terms in groups]
+
+
+def _idf(df, page_total):
+    return math.log((page_total - df + 0.5) / (df + 0.5) + 1.0)
+
+
+def _scored_pages(index, groups, idf, avg_length, k1=BM25_K1, b=BM25_B, skip=()):
+    """
+    Генератор: (score, file_id, page) за всяка страница с поне една от думите
+    """
+    files = index["files"]
+
+    def tagged(i, terms):
+        for key, tf in _term_stream(index, terms):
+            yield key, i, tf
+
+    merged = heapq.merge(*(tagged(i, terms) for i, terms in enumerate(groups)))
+    for (file_id, page), group in groupby(merged, key=lambda p: p[0]):
+        if file_id in skip:
+            continue
+        length = files[file_id]["lengths"][page - 1]
+        norm = k1 * (1 - b + b * length / avg_length) if avg_length else k1
+        yield sum(idf[i] * tf * (k1 + 1) / (tf + norm) for _, i, tf in group), file_id, page
+
+
+def top_k(items, size):
+    """
+    Най-добрите size елемента (по намаляващ ред) от поток, с купчина от най-много size елемента.
+    Връща (подредени, общ брой)
+    """
+    heap = []  # най-слабият резултат е на върха
+    total = 0
+    for item in items:
+        total += 1
+        if len(heap) < size:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+    return sorted(heap, reverse=True), total
+
+
+def bm25_search(index, keywords, k=20, offset=0, whole_words=False, stem=False, k1=BM25_K1, b=BM25_B):
+    """
+    Подрежда страниците по BM25 (честота на думите и дължина на страницата).
+    Постингите се обхождат като слят поток по (файл, страница) и в паметта се
+    държат само най-добрите offset + k страници (ограничена купчина).
+    stem: всички форми на думата (виж normalize.stem_bg) се броят като една.
+    Връща {"total", "offset", "results": [{"file", "page", "score"}]}.
+    """
+    if not isinstance(index, dict):
+        index = load_index(index)
+        if index is None:
+            return {"total": 0, "offset": offset, "results": []}
+
+    files = index["files"]
+    page_total, length_total = _collection_stats(index)
+    avg_length = length_total / page_total if page_total else 0.0
+
+    groups = [terms for _, terms in _query_terms(index, keywords, whole_words, stem)]
+    idf = [_idf(df, page_total) for df in _document_frequencies(index, groups)]
+
+    # (score, -file_id, -page): при равен резултат по-ранните файл/страница са по-напред
+    scored = ((score, -file_id, -page) for score, file_id, page in _scored_pages(index, groups, idf, avg_length, k1, b))
+    ranked, total = top_k(scored, offset + k)
+    return {
+        "total": total,
+        "offset": offset,
+        "results": [
+            {"file": files[-neg_file]["path"], "page": -neg_page, "score": score}
+            for score, neg_file, neg_page in ranked[offset:offset + k]
+        ],
+    }
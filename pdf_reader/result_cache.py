@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+DEFAULT_RESULT_CACHE_DIR = Path.home() / ".cache" / "pdf_reader" / "results"
+DEFAULT_MAX_BYTES = 256 * 1024 ** 2  # 256 MB
+
+
+def library_generation(pdf_files, index_path=None, corpus_path=None):
+    """
+    Поколение на библиотеката: поколението на индекса + настройките на извличане +
+    (път, размер, mtime) на всеки PDF и (с corpus_path) на файловете на корпуса.
+    Сменя се при всяко ново записване на индекса/корпуса и при добавен/променен/изтрит файл.
+    """
+    from index_segments import index_generation
+    from page_cache import EXTRACTION_SETTINGS
+
+    h = hashlib.sha1()
+    h.update(repr(index_generation(index_path) if index_path else None).encode("utf-8"))
+    h.update(json.dumps(EXTRACTION_SETTINGS, sort_keys=True).encode("utf-8"))
+    paths = sorted(str(p) for p in pdf_files)
+    if corpus_path is not None:
+        from corpus_store import corpus_paths
+        paths += [str(p) for p in corpus_paths(Path(corpus_path))]
+    for path in paths:
+        try:
+            st = os.stat(path)
+            h.update(f"{path}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            h.update(f"{path}\0-\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResultWriter:
+    """
+    Запис в кеша, който се пише ред по ред, докато резултатите се намират;
+    става видим едва при commit() (атомарна смяна), discard() го изоставя
+    """
+
+    def __init__(self, cache, entry, generation):
+        self.cache = cache
+        self.entry = entry
+        self.tmp_path = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        self.f = open(self.tmp_path, "w", encoding="utf-8")
+        self.f.write(json.dumps(generation) + "\n")
+
+    def add(self, record):
+        self.f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def commit(self):
+        self.f.close()
+        os.replace(self.tmp_path, self.entry)
+        self.cache.evict()
+
+    def discard(self):
+        self.f.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+class ResultCache:
+    """
+    Дисков LRU кеш: заявка -> резултати (JSONL файл на заявка, ключът е точната заявка).
+    Първият ред на записа е поколението на библиотеката; запис от друго поколение
+    се счита за липсващ и се изтрива. При надвишаване на max_bytes се трият
+    най-отдавна ползваните записи (както в PageCache).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_RESULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def entry_path(self, query):
+        raw = json.dumps(query, sort_keys=True, ensure_ascii=False)
+        return self.cache_dir / f"{hashlib.sha1(raw.encode('utf-8')).hexdigest()}.jsonl"
+
+    def get(self, query, generation):
+        """
+        Итератор по записите (четат се от диска един по един) или None
+        (няма запис или е от друго поколение)
+        """
+        entry = self.entry_path(query)
+        try:
+            f = open(entry, encoding="utf-8")
+        except OSError:
+            return None
+        try:
+            current = json.loads(f.readline()) == generation
+        except ValueError:
+            current = False
+        if not current:
+            f.close()
+            entry.unlink(missing_ok=True)
+            return None
+        os.utime(entry)  # LRU: отбелязва последно ползване
+        return self._records(f)
+
+    def _records(self, f):
+        with f:
+            for line in f:
+                yield json.loads(line)
+
+    def writer(self, query, generation):
+        """
+        ResultWriter за нов запис на заявката (виж ResultWriter)
+        """
+        return ResultWriter(self, self.entry_path(query), generation)
+
+    def put(self, query, generation, records):
+        writer = self.writer(query, generation)
+        for record in records:
+            writer.add(record)
+        writer.commit()
+
+    def evict(self):
+        """
+        Трие най-стари записи (по време на ползване), докато общият размер стане <= max_bytes
+        """
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*.jsonl"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def clear(self):
+        for path in self.cache_dir.glob("*.jsonl"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,401 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from extract_engines import DEFAULT_ENGINE
+from index_segments import DEFAULT_SEGMENTS_NAME, open_index
+from pdf_index import DEFAULT_INDEX_NAME
+
+# Протокол: всяка заявка е JSON обект, отговорът е поток от JSON редове (по един резултат),
+# завършващ с {"done": true, "count": N, "cached": bool, "ms": ...} или {"error": "..."}.
+#   Unix сокет – заявка на ред, няколко заявки по една връзка
+#   HTTP       – GET /<op>?keywords=бездна&keywords=пустота&stem=1 (отговор "chunked" NDJSON)
+# Операции: search (индекс), rank (BM25), query (език на заявките), scan (пълен текст – iter_search).
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 256  # заявки в LRU кеша на резултатите
+DEFAULT_CACHE_BYTES = 64 * 1024 ** 2  # и общ размер на резултатите в него (като JSON)
+QUEUE_SIZE = 256  # резултати, които нишката може да изпревари клиента
+OPS = ("search", "rank", "query", "scan")
+DRAIN_BYTES = 64 * 1024  # изчакваме клиента само когато буферът за изпращане порасне
+_END = object()
+
+
+def normalize_request(request):
+    """
+    Заявка с всички полета и стойности по подразбиране – служи и за ключ в кеша
+    """
+    op = request.get("op", "search")
+    if op not in OPS:
+        raise ValueError(f"Непозната операция: {op!r} (възможни: {', '.join(OPS)})")
+    keywords = request.get("keywords") or []
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    return {
+        "op": op,
+        "keywords": [kw for kw in keywords if kw],
+        "query": request.get("query"),
+        "regex": request.get("regex"),
+        "k": int(request.get("k", 20)),
+        "offset": int(request.get("offset", 0)),
+        "whole_words": bool(request.get("whole_words", False)),
+        "stem": bool(request.get("stem", False)),
+    }
+
+
+class SearchService:
+    """
+    Зарежда индекса веднъж и отговаря на заявки; индексът се презарежда, когато
+    файлът му (или манифестът на сегментите) се смени. Резултатите на последните
+    cache_size заявки (общо до cache_bytes) се пазят в LRU кеш; тези на scan – под
+    поколението на библиотеката (result_cache.library_generation), защото зависят от PDF-ите.
+    """
+
+    def __init__(self, directory, index_path=None, cache_dir=None, engine=DEFAULT_ENGINE, cache_size=DEFAULT_CACHE_SIZE,
+                 cache_bytes=DEFAULT_CACHE_BYTES):
+        self.directory = Path(directory)
+        if index_path is None:
+            index_path = self.directory / DEFAULT_SEGMENTS_NAME
+            if not index_path.exists():
+                index_path = self.directory / DEFAULT_INDEX_NAME
+        self.index_path = Path(index_path)
+        self.engine = engine
+        self.cache_size = cache_size
+        self.cache_bytes = cache_bytes
+        self.results = OrderedDict()  # ключ -> (резултати, размер)
+        self._results_bytes = 0
+        self._index = None
+        self._index_stamp = None
+        self._reload_lock = asyncio.Lock()
+
+        from page_cache import DEFAULT_CACHE_DIR, PageCache
+        self.page_cache = PageCache(cache_dir or DEFAULT_CACHE_DIR)
+        # Извличането/кешът на страници не са за няколко нишки едновременно – scan е в една нишка
+        self._scan_executor = ThreadPoolExecutor(max_workers=1)
+
+    def _stamp(self):
+        path = self.index_path / "manifest.json" if self.index_path.is_dir() else self.index_path
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    async def index(self):
+        """
+        (индекс, отпечатък) – зарежда се наново само ако файлът е сменен на диска.
+        Вика се само от нишката на event loop-а; самото зареждане тече в нишка,
+        за да не спира другите заявки. При смяна кешът на резултатите се чисти.
+        """
+        if self._stamp() != self._index_stamp:
+            async with self._reload_lock:
+                stamp = self._stamp()
+                if stamp != self._index_stamp:
+                    loop = asyncio.get_running_loop()
+                    index = await loop.run_in_executor(None, open_index, self.index_path) if stamp else None
+                    self._index, self._index_stamp = index, stamp
+                    self.results.clear()
+                    self._results_bytes = 0
+        return self._index, self._index_stamp
+
+    def _remember(self, key, items, size):
+        if size > self.cache_bytes:
+            return
+        self.results[key] = (items, size)
+        self._results_bytes += size
+        while len(self.results) > self.cache_size or self._results_bytes > self.cache_bytes:
+            _, (_, old_size) = self.results.popitem(last=False)
+            self._results_bytes -= old_size
+
+    def run(self, request, index, stop=None):
+        """
+        Синхронно изпълнение на нормализирана заявка върху index (от index());
+        генератор на резултати (dict)
+        stop: по желание threading.Event – scan спира между файловете, когато е вдигнат
+        """
+        op = request["op"]
+        if op == "scan":
+            yield from self._scan(request, index, stop)
+            return
+        if index is None:
+            raise FileNotFoundError(f"Няма индекс: {self.index_path}")
+
+        segmented = not isinstance(index, dict)
+        if op == "search":
+            if segmented:
+                results = index.search_index(request["keywords"], request["whole_words"], request["stem"])
+            else:
+                from pdf_index import search_index
+                results = search_index(index, request["keywords"], request["whole_words"], request["stem"])
+            yield from results
+        elif op == "rank":
+            options = {"k": request["k"], "offset": request["offset"],
+                       "whole_words": request["whole_words"], "stem": request["stem"]}
+            if segmented:
+                response = index.bm25_search(request["keywords"], **options)
+            else:
+                from ranking import bm25_search
+                response = bm25_search(index, request["keywords"], **options)
+            yield from response["results"]
+        else:
+            if segmented:
+                results = index.search_query(request["query"] or "", request["stem"])
+            else:
+                from query_lang import search_query
+                results = search_query(index, request["query"] or "", request["stem"])
+            yield from results
+
+    def _scan(self, request, index, stop=None):
+        from pdf_reader import iter_search
+
+        for pdf_file in sorted(self.directory.glob("*.pdf")):
+            if stop is not None and stop.is_set():
+                return
+            try:
+                for hit in iter_search(pdf_file, keywords=request["keywords"] or None, regex=request["regex"],
+                                       index=index, cache=self.page_cache, engine=self.engine, stem=request["stem"]):
+                    yield {"file": str(pdf_file), **hit}
+            except Exception as e:
+                yield {"file": str(pdf_file), "error": f"{type(e).__name__}: {e}"}
+
+    async def stream(self, request):
+        """
+        Асинхронен генератор: резултатите на заявката, докато се намират
+        (от кеша – наведнъж). Последният елемент е {"done": ...} или {"error": ...}.
+        """
+        t0 = time.perf_counter()
+        try:
+            request = normalize_request(request)
+        except (ValueError, TypeError) as e:
+            yield {"error": f"{type(e).__name__}: {e}"}
+            return
+
+        try:
+            index, stamp = await self.index()  # презарежда (и чисти кеша), ако индексът е сменен
+        except Exception as e:
+            yield {"error": f"{type(e).__name__}: {e}"}
+            return
+        # отпечатъкът на индекса е в ключа – резултат от стар индекс не се връща за нов
+        key = json.dumps([request, stamp], sort_keys=True, ensure_ascii=False)
+        if request["op"] == "scan":
+            from result_cache import library_generation
+            key += library_generation(self.directory.glob("*.pdf"))
+        cached = self.results.get(key)
+        if cached is not None:
+            self.results.move_to_end(key)
+            for item in cached[0]:
+                yield item
+            yield {"done": True, "count": len(cached[0]), "cached": True, "ms": (time.perf_counter() - t0) * 1000}
+            return
+
+        loop = asyncio.get_running_loop()
+        # ограничената опашка спира нишката, ако клиентът не смогва; stop – ако си е отишъл
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(item):
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while not stop.is_set():
+                try:
+                    future.result(timeout=1.0)
+                    return
+                except concurrent.futures.TimeoutError:
+                    continue
+            future.cancel()
+
+        def produce():
+            try:
+                for item in self.run(request, index, stop):
+                    if stop.is_set():
+                        return
+                    put(item)
+            except Exception as e:
+                put({"error": f"{type(e).__name__}: {e}"})
+            put(_END)
+
+        executor = self._scan_executor if request["op"] == "scan" else None
+        loop.run_in_executor(executor, produce)
+
+        items = []
+        size = 0
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if "error" in item and "file" not in item:
+                    yield item
+                    return
+                items.append(item)
+                size += len(json.dumps(item, ensure_ascii=False))
+                yield item
+        finally:
+            stop.set()  # нормален край или прекъсната връзка – нишката спира при следващия резултат
+
+        if stamp == self._index_stamp:  # индексът не е сменен, докато заявката е текла
+            self._remember(key, items, size)
+        yield {"done": True, "count": len(items), "cached": False, "ms": (time.perf_counter() - t0) * 1000}
+
+
+def _line(item):
+    return json.dumps(item, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+async def _send(writer, data):
+    # write() изпраща веднага, ако може; drain() на всеки ред би забавил кешираните отговори
+    if writer.is_closing():
+        raise ConnectionResetError("Клиентът затвори връзката")
+    writer.write(data)
+    if writer.transport.get_write_buffer_size() > DRAIN_BYTES:
+        await writer.drain()
+
+
+async def handle_socket(service, reader, writer):
+    """
+    Unix сокет: JSON заявка на ред -> JSON редове
+    """
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                writer.write(_line({"error": f"{type(e).__name__}: {e}"}))
+                await writer.drain()
+                continue
+            # aclosing: при прекъсната връзка stream() спира веднага и сигнализира на нишката си
+            async with aclosing(service.stream(request)) as items:
+                async for item in items:
+                    await _send(writer, _line(item))
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def http_request(target):
+    """
+    "/rank?keywords=бездна&k=5" -> {"op": "rank", "keywords": ["бездна"], "k": "5"}
+    """
+    url = urlsplit(target)
+    params = parse_qs(url.query)
+    request = {"op": url.path.strip("/") or "search", "keywords": params.pop("keywords", [])}
+    for name, values in params.items():
+        value = values[-1]
+        request[name] = value not in ("0", "false", "") if name in ("stem", "whole_words") else value
+    return request
+
+
+async def handle_http(service, reader, writer):
+    """
+    Минимален HTTP/1.1 (само GET) с поточен NDJSON отговор (Transfer-Encoding: chunked)
+    """
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass  # заглавията не ни трябват
+        parts = request_line.decode("latin-1").split()
+        if len(parts) < 2 or parts[0] != "GET":
+            writer.write(b"HTTP/1.1 405 Method Not Allowed\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            return
+
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson; charset=utf-8\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        async with aclosing(service.stream(http_request(parts[1]))) as items:
+            async for item in items:
+                data = _line(item)
+                await _send(writer, f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, socket_path=None, host="127.0.0.1", port=DEFAULT_PORT):
+    """
+    Слуша на Unix сокет (socket_path) или на host:port (HTTP) до прекъсване
+    """
+    if socket_path:
+        Path(socket_path).unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(lambda r, w: handle_socket(service, r, w), path=str(socket_path))
+    else:
+        server = await asyncio.start_server(lambda r, w: handle_http(service, r, w), host=host, port=port)
+    async with server:
+        await server.serve_forever()
+
+
+def ask(request, socket_path):
+    """
+    Клиент за Unix сокета: генератор на отговорите (без последния "done" ред)
+    """
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        sock.sendall(_line(request))
+        with sock.makefile("rb") as f:
+            for line in f:
+                item = json.loads(line)
+                if "done" in item:
+                    return
+                if "error" in item and "file" not in item:
+                    raise RuntimeError(item["error"])
+                yield item
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Local search daemon that keeps the PDF index loaded.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="start the daemon")
+    p_serve.add_argument("directory", help="directory with PDF files")
+    p_serve.add_argument("--index", help="index file or segment directory (default: the one in <directory>)")
+    p_serve.add_argument("--socket", help="listen on this Unix socket instead of HTTP")
+    p_serve.add_argument("--host", default="127.0.0.1", help="HTTP host (default 127.0.0.1)")
+    p_serve.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"HTTP port (default {DEFAULT_PORT})")
+    p_serve.add_argument("--engine", default=DEFAULT_ENGINE, help="text extraction engine for scan")
+    p_serve.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="queries kept in the result cache")
+    p_serve.add_argument("--cache-mb", type=int, default=DEFAULT_CACHE_BYTES // 1024 ** 2, help="max total size of the cached results in MB")
+
+    p_ask = sub.add_parser("ask", help="send one request to a daemon on a Unix socket")
+    p_ask.add_argument("socket", help="Unix socket path")
+    p_ask.add_argument("op", choices=OPS, help="operation")
+    p_ask.add_argument("terms", nargs="*", help="keywords (or the query for 'query')")
+    p_ask.add_argument("--regex", help="regular expression for scan")
+    p_ask.add_argument("-k", type=int, default=20, help="ranked results (rank)")
+    p_ask.add_argument("--stem", action="store_true", help="match Bulgarian word forms by stem")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = SearchService(args.directory, index_path=args.index, engine=args.engine, cache_size=args.cache_size,
+                                cache_bytes=args.cache_mb * 1024 ** 2)
+        where = args.socket or f"http://{args.host}:{args.port}/"
+        print(f"🔎 Търсене в {args.directory} на {where}, Ctrl+C за край", flush=True)
+        try:
+            asyncio.run(serve(service, socket_path=args.socket, host=args.host, port=args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        request = {"op": args.op, "regex": args.regex, "k": args.k, "stem": args.stem}
+        if args.op == "query":
+            request["query"] = " ".join(args.terms)
+        else:
+            request["keywords"] = args.terms
+        for item in ask(request, args.socket):
+            sys.stdout.write(json.dumps(item, ensure_ascii=False) + "\n")
@@ -0,0 +1,119 @@
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+STAGES = ("parse", "layout", "text", "match")
+
+
+class SearchTimings:
+    """
+    Записва времена по файл и страница за етапите parse (разбор на PDF
+    съдържанието), layout (layout анализ), text (сглобяване на текста) и
+    match (търсене), плюс броя символи на страница. Включва се по желание –
+    подава се като timings=... на iter_search / extract_text_by_page.
+    """
+
+    def __init__(self):
+        # (file, page) -> {"file", "page", "parse", "layout", "text", "match", "chars"}
+        self.pages = {}
+
+    def page(self, pdf_path, page_number):
+        key = (str(pdf_path), page_number)
+        record = self.pages.get(key)
+        if record is None:
+            record = {"file": key[0], "page": page_number, "chars": 0}
+            record.update((stage, 0.0) for stage in STAGES)
+            self.pages[key] = record
+        return record
+
+    def add(self, pdf_path, page_number, stage, seconds):
+        self.page(pdf_path, page_number)[stage] += seconds
+
+    def set_chars(self, pdf_path, page_number, chars):
+        self.page(pdf_path, page_number)["chars"] = chars
+
+    @contextmanager
+    def measure(self, pdf_path, page_number, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(pdf_path, page_number, stage, time.perf_counter() - t0)
+
+    def merge(self, records):
+        """
+        Добавя записи (напр. от работен процес на search_library)
+        """
+        for r in records:
+            record = self.page(r["file"], r["page"])
+            for stage in STAGES:
+                record[stage] += r.get(stage, 0.0)
+            record["chars"] = max(record["chars"], r.get("chars", 0))
+
+    def records(self):
+        return list(self.pages.values())
+
+    def files(self):
+        """
+        Сумарни времена по файл
+        """
+        files = {}
+        for r in self.pages.values():
+            f = files.setdefault(r["file"], {"file": r["file"], "pages": 0, "chars": 0, "seconds": 0.0,
+                                             **{stage: 0.0 for stage in STAGES}})
+            f["pages"] += 1
+            f["chars"] += r["chars"]
+            for stage in STAGES:
+                f[stage] += r[stage]
+                f["seconds"] += r[stage]
+        return list(files.values())
+
+    def summary(self, top=10):
+        """
+        Обобщение: общо време по етапи, страници/сек и най-бавните файлове и страници
+        """
+        files = self.files()
+        stage_totals = {stage: sum(r[stage] for r in self.pages.values()) for stage in STAGES}
+        total = sum(stage_totals.values())
+
+        def page_seconds(r):
+            return sum(r[stage] for stage in STAGES)
+
+        slowest_pages = sorted(self.pages.values(), key=page_seconds, reverse=True)[:top]
+        return {
+            "files": len(files),
+            "pages": len(self.pages),
+            "chars": sum(r["chars"] for r in self.pages.values()),
+            "seconds": total,
+            "pages_per_sec": len(self.pages) / total if total else 0.0,
+            "stages": stage_totals,
+            "slowest_files": sorted(files, key=lambda f: f["seconds"], reverse=True)[:top],
+            "slowest_pages": [{**r, "seconds": page_seconds(r)} for r in slowest_pages],
+        }
+
+    def to_json(self, path):
+        """
+        Записва всички записи и обобщението като JSON
+        """
+        data = {"summary": self.summary(), "files": self.files(), "pages": self.records()}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+
+def format_summary(summary):
+    """
+    Кратък текстов отчет от SearchTimings.summary()
+    """
+    lines = [
+        f"Файлове: {summary['files']}, страници: {summary['pages']}, символи: {summary['chars']}",
+        f"Време: {summary['seconds']:.2f} s, {summary['pages_per_sec']:.1f} стр./s",
+        "Етапи: " + ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in summary["stages"].items()),
+        "Най-бавни файлове:",
+    ]
+    for f in summary["slowest_files"]:
+        lines.append(f"  {f['seconds']:8.2f} s  {f['pages']:5d} стр.  {Path(f['file']).name}")
+    lines.append("Най-бавни страници:")
+    for r in summary["slowest_pages"]:
+        lines.append(f"  {r['seconds']:8.3f} s  стр. {r['page']:<5d} {Path(r['file']).name}")
+    return "\n".join(lines)